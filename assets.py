@@ -0,0 +1,216 @@
+import atexit
+import threading
+import pygame
+import textures
+
+##################
+# Asset Registry #
+##################
+
+# Loads each image and sound the first time it is asked for, and hands back
+# the same one every time after that, so nothing is loaded just by importing
+# the game. Once the display mode is set, images are converted to the
+# display's pixel format as they are loaded.
+#
+# A preload can load everything on a worker thread ahead of time, such as
+# while the splash screen shows. It also packs the small images into one
+# texture atlas; images asked for after that are subsurfaces of the atlas.
+#
+# With an asset bundle, the assets in it are made from the bundle instead of
+# their files.
+class AssetRegistry(object):
+	def __init__(self):
+		self.images = {} # Maps a path to its image.
+		self.sounds = {} # Maps a path to its sound.
+		self.fonts = {} # Maps a (path, size) to its font.
+		self.bundle = None
+		self.lock = threading.RLock()
+		self.displayReady = False
+		self.atlas = None
+		self.preloader = None
+
+	def image(self, path):
+		with self.lock:
+			if path in self.images:
+				return self.images[path]
+		if self.bundle != None and path in self.bundle:
+			image = self.bundle.image(path)
+		else:
+			image = pygame.image.load(path)
+		with self.lock:
+			if path not in self.images: # Unless the preload got there first.
+				if self.displayReady:
+					image = textures.convertImage(image)
+				self.images[path] = image
+			return self.images[path]
+
+	# Sounds are loaded with their volume, which is only set when the sound
+	# is first loaded.
+	def sound(self, path, volume=None):
+		with self.lock:
+			if path in self.sounds:
+				return self.sounds[path]
+		sound = None
+		if self.bundle != None and path in self.bundle:
+			sound = self.bundle.sound(path)
+		if sound == None:
+			sound = pygame.mixer.Sound(path)
+		if volume != None:
+			sound.set_volume(volume)
+		with self.lock:
+			return self.sounds.setdefault(path, sound)
+
+	def font(self, path, size):
+		with self.lock:
+			if (path, size) not in self.fonts:
+				if self.bundle != None and path in self.bundle:
+					font = pygame.font.Font(self.bundle.fontFile(path), size)
+				else:
+					font = pygame.font.Font(path, size)
+				self.fonts[(path, size)] = font
+			return self.fonts[(path, size)]
+
+	# Makes the assets in the bundle from it, instead of from their files.
+	# Only assets which haven't been loaded yet are affected.
+	def useBundle(self, bundle):
+		with self.lock:
+			self.bundle = bundle
+
+	# Run once the display mode is set. Converts the images loaded so far.
+	def setDisplayReady(self):
+		with self.lock:
+			if self.displayReady:
+				return
+			self.displayReady = True
+			for path in self.images:
+				self.images[path] = textures.convertImage(self.images[path])
+
+	# Starts loading the images and (path, volume) sounds on a worker thread,
+	# and then packs the images in atlasPaths into a texture atlas. Only the
+	# first preload does anything. The display mode has to be set first.
+	def preload(self, imagePaths, sounds, atlasPaths):
+		with self.lock:
+			if self.preloader != None:
+				return
+			self.preloader = threading.Thread(target=self.runPreload,
+											  args=(imagePaths, sounds, atlasPaths))
+			self.preloader.daemon = True
+			self.preloader.start()
+			atexit.register(self.preloader.join) # Don't exit halfway through a load.
+
+	def runPreload(self, imagePaths, sounds, atlasPaths):
+		for path in imagePaths:
+			self.image(path)
+		for path, volume in sounds:
+			try:
+				self.sound(path, volume)
+			except (pygame.error, IOError):
+				pass # It fails again, where it's played, if it's really missing.
+
+		images = []
+		for path in atlasPaths:
+			images.append(self.image(path))
+		atlas = textures.TextureAtlas(images)
+		with self.lock:
+			self.atlas = atlas
+			for path in atlasPaths:
+				self.images[path] = atlas[self.images[path]]
+
+	# Waits for the preload, if there is one, to finish.
+	def waitForPreload(self):
+		with self.lock:
+			preloader = self.preloader
+		if preloader != None:
+			preloader.join()
+
+
+# Stands in for a sound which is only loaded by the registry the first time
+# it is played.
+class LazySound(object):
+	def __init__(self, registry, path, volume=None):
+		self.registry = registry
+		self.path = path
+		self.volume = volume
+
+	def load(self):
+		return self.registry.sound(self.path, self.volume)
+
+	def play(self, *args):
+		return self.load().play(*args)
+
+	def stop(self):
+		# A sound which was never loaded was never played.
+		if self.path in self.registry.sounds:
+			self.load().stop()
+
+	def set_volume(self, volume):
+		self.volume = volume
+		if self.path in self.registry.sounds:
+			self.load().set_volume(volume)
+
+
+#########
+# Music #
+#########
+
+# A music track, which is streamed from its file through the mixer's music
+# channel instead of being loaded whole like a sound. Only one track plays
+# at a time; playing one stops the last.
+class MusicTrack(object):
+	loaded = None # The track the music channel last loaded.
+
+	def __init__(self, path, volume=None):
+		self.path = path
+		self.volume = volume
+
+	def play(self, loops=0):
+		pygame.mixer.music.load(self.path)
+		MusicTrack.loaded = self
+		# Loading a track resets the volume, so it's set afterwards.
+		if self.volume != None:
+			pygame.mixer.music.set_volume(self.volume)
+		pygame.mixer.music.play(loops)
+
+	def stop(self):
+		if MusicTrack.loaded is self:
+			pygame.mixer.music.stop()
+
+	def set_volume(self, volume):
+		self.volume = volume
+		if MusicTrack.loaded is self:
+			pygame.mixer.music.set_volume(volume)
+
+
+# Stands in for a sound or music track when the game runs without audio.
+class SilentSound(object):
+	def __init__(self, path=None, volume=None):
+		self.path = path
+		self.volume = volume
+
+	def play(self, *args):
+		pass
+
+	def stop(self):
+		pass
+
+	def set_volume(self, volume):
+		self.volume = volume
+
+
+# Like pygame.mixer's stop, pause and unpause, but they cover the music
+# too, which plays apart from the other channels. Without a mixer they do
+# nothing.
+def stopAll():
+	if pygame.mixer.get_init() != None:
+		pygame.mixer.stop()
+		pygame.mixer.music.stop()
+
+def pauseAll():
+	if pygame.mixer.get_init() != None:
+		pygame.mixer.pause()
+		pygame.mixer.music.pause()
+
+def unpauseAll():
+	if pygame.mixer.get_init() != None:
+		pygame.mixer.unpause()
+		pygame.mixer.music.unpause()
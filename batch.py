@@ -0,0 +1,234 @@
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import bundle
+import project
+import simulate
+
+#################
+# Batch Running #
+#################
+
+# Plays many headless games at once, spread over a pool of processes, to see
+# how far players get and how they score across seeds, terrains and ways of
+# playing. Each process keeps one game of its own, with no window or audio,
+# and plays one run after another on it, so the runs share nothing and it
+# scales with the number of cores. Run
+#   python batch.py --seeds 1-1000 --out runs.jsonl
+# to play every seed on every terrain with every policy, writing one line of
+# JSON per run as it finishes, or to a CSV file if the path ends in ".csv".
+# "--contours Hills,Mountains" and "--policies run,bot" choose what's played,
+# where a policy is "run", "bot", "idle" or the path of a script, and
+# "--frames N" ends a run after N ticks if the player is still alive.
+# "--workers N" sets the number of processes, one per core by default, and
+# "--horde N" plays every run in the stress mode. "--pool-bullets N" and the
+# like set the pool sizes, as in the game.
+
+fields = ["seed", "contour", "policy", "hordeSize", "ticks", "score", "distance",
+		  "deathTick", "boss", "seconds"]
+
+
+# Plays like a player would: runs right shooting, jumps over walls and the
+# enemies in the way, and turns to face the final boss. It's given to a run
+# in place of a script.
+class Bot(object):
+	lookAhead = 4 # How many tiles ahead an enemy is jumped over from.
+
+	def __init__(self):
+		self.lastX = None
+
+	def apply(self, frame, data):
+		player = data.player
+		if frame == 0:
+			project.applyAction(data, "Hold Right")
+		if frame % 6 == 0:
+			project.applyAction(data, "Shoot")
+
+		for boss in data.finalBoss:
+			right = boss.rect.centerx > player.rect.centerx
+			if right != player.keyBoardRight:
+				project.applyAction(data, "Hold Right" if right else "Release Right")
+				project.applyAction(data, "Release Left" if right else "Hold Left")
+
+		# Stopped against a wall or an enemy close ahead.
+		blocked = player.rect.x == self.lastX
+		self.lastX = player.rect.x
+		if player.isGrounded == True and (blocked or self.enemyAhead(data)):
+			project.applyAction(data, "Jump")
+		elif player.isGrounded == False and blocked and player.dy >= 0:
+			project.applyAction(data, "Jump")
+		return False
+
+	def enemyAhead(self, data):
+		player = data.player
+		enemies = data.enemies
+		n = len(enemies)
+		if n == 0:
+			return False
+		ahead = enemies.x[:n] - player.rect.right
+		near = (ahead > -enemies.width)&(ahead < Bot.lookAhead*data.tileSize)
+		level = abs(enemies.y[:n] - player.rect.y) < 2*data.tileSize
+		return bool((near&level).any())
+
+
+# Returns the input for a run played with the given policy.
+def policyInput(policy, frames):
+	if policy == "run":
+		return simulate.defaultScript(frames)
+	elif policy == "bot":
+		return Bot()
+	elif policy == "idle":
+		return simulate.ScriptedInput([])
+	return simulate.ScriptedInput.load(policy)
+
+
+# The game each worker process plays its runs on, made when it starts.
+workerData = None
+
+def startWorker(poolSizes=None):
+	global workerData
+	os.environ["SDL_VIDEODRIVER"] = "dummy"
+	if os.path.exists(bundle.bundlePath):
+		project.assetRegistry.useBundle(bundle.Bundle())
+	workerData = simulate.newMenu(poolSizes=poolSizes)
+
+
+# Plays one run, given as (seed, contour, policy, frames, hordeSize), until
+# the player dies, the boss is beaten or the frames run out. Returns its
+# results, with the boss as "not reached", "rising", "fighting" or
+# "defeated".
+def playRun(run):
+	seed, contour, policy, frames, hordeSize = run
+	data = workerData
+	start = time.time()
+	project.initMenu(data)
+	data.seed = seed
+	data.contour = contour
+	data.hordeSize = hordeSize
+	data.waitForTerrain = True # So the same run always plays out the same.
+	project.initGame(data)
+	script = policyInput(policy, frames)
+
+	deathTick = None
+	boss = "not reached"
+	for frame in xrange(frames):
+		script.apply(frame, data)
+		project.updateGame(data)
+		if len(data.finalBoss) > 0:
+			boss = "fighting"
+		elif boss == "fighting":
+			boss = "defeated"
+			break
+		elif data.finalBossBegun == True:
+			boss = "rising"
+		if data.player.alive == False:
+			deathTick = data.tick
+			break
+	project.stopTerrainProducer(data)
+	return {"seed": seed, "contour": contour, "policy": policy, "hordeSize": hordeSize,
+			"ticks": data.tick, "score": data.score,
+			"distance": data.cameraAdjustDistance, "deathTick": deathTick,
+			"boss": boss, "seconds": round(time.time() - start, 3)}
+
+
+# Returns the seeds in a list like "1-100,200,300".
+def seedList(text):
+	seeds = []
+	for part in text.split(","):
+		if "-" in part:
+			first, last = part.split("-")
+			seeds.extend(xrange(int(first), int(last) + 1))
+		else:
+			seeds.append(int(part))
+	return seeds
+
+
+# Writes each run's results as it comes in, as JSON lines or CSV rows.
+class ResultWriter(object):
+	def __init__(self, path):
+		self.file = open(path, "wb" if path.endswith(".csv") else "w")
+		self.rows = None
+		if path.endswith(".csv"):
+			self.rows = csv.DictWriter(self.file, fields)
+			self.rows.writeheader()
+
+	def write(self, result):
+		if self.rows != None:
+			self.rows.writerow(result)
+		else:
+			self.file.write(json.dumps(result, sort_keys=True) + "\n")
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+
+# Prints, for each terrain and policy, how many runs died and beat the
+# boss, and their average distance and score.
+def printSummary(results):
+	groups = {}
+	for result in results:
+		groups.setdefault((result["contour"], result["policy"]), []).append(result)
+	for key in sorted(groups):
+		group = groups[key]
+		deaths = len([result for result in group if result["deathTick"] != None])
+		defeated = len([result for result in group if result["boss"] == "defeated"])
+		distance = sum(result["distance"] for result in group)/float(len(group))
+		score = sum(result["score"] for result in group)/float(len(group))
+		print("%-10s %-10s %5d runs  %5.1f%% died  %5.1f%% beat the boss  "
+			  "distance %8.0f  score %8.0f" %
+			  (key[0], key[1][-10:], len(group), 100.0*deaths/len(group),
+			   100.0*defeated/len(group), distance, score))
+
+
+def argument(arguments, name, default):
+	if name in arguments:
+		return arguments[arguments.index(name) + 1]
+	return default
+
+
+def main():
+	arguments = sys.argv[1:]
+	seeds = seedList(argument(arguments, "--seeds", "1-100"))
+	contours = argument(arguments, "--contours", "Plains,Hills,Mountains").split(",")
+	policies = argument(arguments, "--policies", "run,bot").split(",")
+	frames = int(argument(arguments, "--frames", 3600))
+	workers = int(argument(arguments, "--workers", multiprocessing.cpu_count()))
+	outPath = argument(arguments, "--out", "runs.jsonl")
+	hordeSize = project.hordeSizeArgument(arguments)
+	poolSizes = project.poolSizesArgument(arguments)
+
+	runs = []
+	for seed in seeds:
+		for contour in contours:
+			for policy in policies:
+				runs.append((seed, contour, policy, frames, hordeSize))
+
+	writer = ResultWriter(outPath)
+	pool = multiprocessing.Pool(workers, startWorker, (poolSizes,))
+	results = []
+	start = time.time()
+	try:
+		for result in pool.imap_unordered(playRun, runs):
+			writer.write(result)
+			results.append(result)
+		pool.close()
+	except KeyboardInterrupt:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+		writer.close()
+
+	seconds = time.time() - start
+	ticks = sum(result["ticks"] for result in results)
+	print("%d runs in %.1f s on %d workers: %.1f runs, %.0f ticks per second" %
+		  (len(results), seconds, workers, len(results)/seconds, ticks/seconds))
+	printSummary(results)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import pygame
+import terrain
+import textures
+
+##################
+# Blit Benchmark #
+##################
+
+# Times how long drawing a terrain-heavy screen takes with the images as
+# they are loaded, and with them converted to the display's pixel format.
+# Run "python benchmark.py" to see the difference, or add "--headless" to
+# run it without opening a window.
+
+width = 964
+height = 632
+tileSize = 32
+rows = 20
+cols = 30
+frames = 300
+
+
+# Returns the milliseconds one call to draw takes, on average.
+def timeFrames(surface, draw):
+	start = time.time()
+	for frame in xrange(frames):
+		surface.fill((0, 0, 0))
+		draw(surface)
+	return 1000*(time.time() - start)/frames
+
+
+# Returns a function which draws the screen one tile at a time, with the
+# surface between rows 10 and 12 and underground tiles below it.
+def tileScene(tileImages):
+	def draw(surface):
+		for col in xrange(cols+1):
+			for row in xrange(10, rows):
+				if row <= 12:
+					image = tileImages[terrain.ground]
+				else:
+					image = tileImages[terrain.underground]
+				surface.blit(image, (col*tileSize, row*tileSize))
+	return draw
+
+
+# Returns a function which draws the same screen from one baked chunk. If
+# plain is True the chunk is copied to a plain 32 bit surface first, as
+# chunks were before they used the display's pixel format.
+def chunkScene(tileImages, plain):
+	chunks = terrain.ChunkCache(rows, tileSize, cols+1)
+	for col in xrange(cols+1):
+		strip = terrain.bakeColumnStrip(10, 12, rows, tileSize, tileImages)
+		chunks.bakeColumn(col, strip)
+	chunk = chunks.chunks[0]
+	if plain:
+		chunk = pygame.Surface(chunk.get_size(), 0, 32)
+		chunk.fill(terrain.chunkColorKey)
+		chunk.blit(chunks.chunks[0], (0, 0))
+		chunk.set_colorkey(terrain.chunkColorKey)
+	def draw(surface):
+		surface.blit(chunk, (0, 0))
+	return draw
+
+
+def main():
+	if "--headless" in sys.argv[1:]:
+		os.environ["SDL_VIDEODRIVER"] = "dummy"
+	pygame.init()
+	surface = pygame.display.set_mode((width, height), 0, 32)
+
+	loaded = {}
+	loaded[terrain.ground] = pygame.image.load("images/green.png")
+	loaded[terrain.underground] = pygame.image.load("images/brown.png")
+	atlas = textures.TextureAtlas(loaded.values())
+	converted = {}
+	for tile in loaded:
+		converted[tile] = atlas[loaded[tile]]
+
+	results = []
+	results.append(("tiles, as loaded", timeFrames(surface, tileScene(loaded))))
+	results.append(("tiles, from the atlas", timeFrames(surface, tileScene(converted))))
+	results.append(("chunk, plain 32 bit", timeFrames(surface, chunkScene(loaded, True))))
+	results.append(("chunk, display format", timeFrames(surface, chunkScene(converted, False))))
+
+	for i in xrange(len(results)):
+		name, milliseconds = results[i]
+		line = "%-24s %7.3f ms per frame" % (name, milliseconds)
+		if i % 2 == 1:
+			line += "  (%.1fx faster)" % (results[i-1][1]/milliseconds)
+		print(line)
+	pygame.quit()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,75 @@
+import numpy
+import slots
+
+##################
+# Bullet Physics #
+##################
+
+# Holds every bullet in the game as parallel arrays instead of sprites, so
+# moving them, testing them against the terrain and culling them are each a
+# handful of vectorized operations over all the bullets at once.
+class BulletSystem(slots.MovingSlots):
+	bulletSpeed = 20
+	fields = [("x", numpy.int32), ("y", numpy.int32),
+			  ("previousX", numpy.int32), ("previousY", numpy.int32),
+			  ("dx", numpy.int32), ("dy", numpy.int32),
+			  ("width", numpy.int32), ("height", numpy.int32),
+			  ("facingLeft", bool)]
+
+	def __init__(self, images, capacity=64):
+		self.images = images # Maps "Right"/"Left" to the bullet's image.
+		self.sizes = {}
+		for direction in images:
+			self.sizes[direction] = images[direction].get_size()
+		slots.MovingSlots.__init__(self, capacity)
+
+	# Fires a bullet from (x, y). The shooter's own speed is added on.
+	def spawn(self, x, y, direction, additionalSpeed):
+		i = self.add()
+		if direction == "Right":
+			speed = BulletSystem.bulletSpeed + additionalSpeed
+		else:
+			direction = "Left"
+			speed = -BulletSystem.bulletSpeed + additionalSpeed
+		self.x[i] = self.previousX[i] = x
+		self.y[i] = self.previousY[i] = y
+		self.dx[i] = int(speed) # Rects only move by whole pixels.
+		self.dy[i] = 0
+		self.width[i], self.height[i] = self.sizes[direction]
+		self.facingLeft[i] = (direction == "Left")
+
+	# Moves every bullet and removes the ones which hit the terrain on the
+	# way or left the screen. The terrain test sweeps each bullet's box from
+	# where it was to where it is, so fast bullets can't pass through walls.
+	def update(self, tileMap, tileSize, tile, cameraLeft, screenWidth):
+		n = self.count
+		x, y = self.x[:n], self.y[:n]
+		dx, dy = self.dx[:n], self.dy[:n]
+		width, height = self.width[:n], self.height[:n]
+
+		lefts = numpy.minimum(x, x + dx)
+		rights = numpy.maximum(x, x + dx) + width
+		tops = numpy.minimum(y, y + dy)
+		bottoms = numpy.maximum(y, y + dy) + height
+		hits = tileMap.anyInBoxes(lefts, tops, rights, bottoms, tileSize, tile)
+
+		x += dx
+		y += dy
+		screenX = x - cameraLeft
+		self.keepOnly(~hits & (screenX >= 0) & (screenX <= screenWidth))
+
+	# Returns the bullets' boxes as (lefts, tops, rights, bottoms) arrays.
+	def boxes(self):
+		x = self.x[:self.count]
+		y = self.y[:self.count]
+		return x, y, x + self.width[:self.count], y + self.height[:self.count]
+
+	def draw(self, surface, camera, alpha=1):
+		right = self.images["Right"]
+		left = self.images["Left"]
+		x, y = self.drawPositions(camera, alpha)
+		for i in xrange(self.count):
+			if self.facingLeft[i]:
+				surface.blit(left, (x[i], y[i]))
+			else:
+				surface.blit(right, (x[i], y[i]))
@@ -0,0 +1,158 @@
+import io
+import json
+import mmap
+import os
+import struct
+import pygame
+
+################
+# Asset Bundle #
+################
+
+# Packs every asset into one file, so starting the game reads one file
+# instead of decoding dozens of PNGs and WAVs. Images are kept as raw
+# pixels and sounds as samples in the mixer's format, so nothing has to be
+# decoded. Run "python bundle.py" to build it again after changing any
+# asset; the game uses it whenever it's there. An asset whose file has
+# changed since it was bundled is loaded from its file instead.
+#
+# The file starts with a header and a JSON index, which maps each asset's
+# path to where its data is, and the size and modification time its file
+# had, and then the data itself.
+
+bundlePath = "assets.bundle"
+bundleMagic = b"NEWMOON1"
+headerFormat = "<8sI" # The magic, then the length of the index.
+alignment = 16
+assetFolders = ["images", "sounds", "fonts"] # The music is streamed from its files.
+
+
+def aligned(offset):
+	return (offset + alignment - 1)//alignment*alignment
+
+
+# Returns the index entry and data for the asset at path, or None if it
+# isn't a kind of asset that goes in the bundle.
+def packAsset(path):
+	extension = os.path.splitext(path)[1].lower()
+	if extension == ".png":
+		image = pygame.image.load(path)
+		if image.get_flags() & pygame.SRCALPHA:
+			pixelFormat = "RGBA"
+		else:
+			pixelFormat = "RGB"
+		data = pygame.image.tostring(image, pixelFormat)
+		entry = {"kind": "image", "format": pixelFormat,
+				 "width": image.get_width(), "height": image.get_height()}
+	elif extension == ".wav":
+		data = pygame.mixer.Sound(path).get_raw()
+		entry = {"kind": "sound", "mixer": list(pygame.mixer.get_init())}
+	elif extension == ".ttf":
+		with open(path, "rb") as fontFile:
+			data = fontFile.read()
+		entry = {"kind": "font"}
+	else:
+		return None
+	return entry, data
+
+
+# Writes the bundle of every asset in the asset folders. The mixer has to
+# be set up the same way as the game's, since the sounds are stored in its
+# format.
+def buildBundle(path=bundlePath):
+	index = {}
+	chunks = []
+	offset = 0
+	for folder in assetFolders:
+		for name in sorted(os.listdir(folder)):
+			packed = packAsset(folder + "/" + name)
+			if packed == None:
+				continue
+			entry, data = packed
+			source = os.stat(folder + "/" + name)
+			entry["sourceSize"] = source.st_size
+			entry["sourceTime"] = source.st_mtime
+			offset = aligned(offset)
+			entry["offset"] = offset
+			entry["size"] = len(data)
+			index[folder + "/" + name] = entry
+			chunks.append((offset, data))
+			offset += len(data)
+
+	indexData = json.dumps(index, sort_keys=True).encode("utf-8")
+	header = struct.pack(headerFormat, bundleMagic, len(indexData))
+	dataStart = aligned(len(header) + len(indexData))
+	with open(path, "wb") as bundleFile:
+		bundleFile.write(header)
+		bundleFile.write(indexData)
+		for offset, data in chunks:
+			bundleFile.seek(dataStart + offset)
+			bundleFile.write(data)
+	return index
+
+
+# A built bundle, memory-mapped so an asset is only read from the disk
+# when it's used. Images and sounds are made from the mapped pixels and
+# samples, which saves decoding them, but not copying them: pygame copies a
+# sound's samples into the mixer, and the registry converts each image to
+# the display's pixel format once the display is set.
+class Bundle(object):
+	def __init__(self, path=bundlePath):
+		self.file = open(path, "rb")
+		# A copy-on-write mapping, so drawing onto an image that shares its
+		# pixels with the bundle can't crash or change the file.
+		self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_COPY)
+		headerSize = struct.calcsize(headerFormat)
+		magic, indexSize = struct.unpack(headerFormat, self.map[:headerSize])
+		if magic != bundleMagic:
+			raise ValueError("%s is not an asset bundle" % path)
+		self.index = json.loads(self.map[headerSize:headerSize + indexSize].decode("utf-8"))
+		self.dataStart = aligned(headerSize + indexSize)
+
+	# Whether the asset is in the bundle and its file hasn't changed since it
+	# was bundled, or is gone. Bundles built before the sizes and times were
+	# kept count as changed.
+	def __contains__(self, path):
+		entry = self.index.get(path)
+		if entry == None:
+			return False
+		try:
+			source = os.stat(path)
+		except OSError:
+			return True
+		return (source.st_size == entry.get("sourceSize") and
+				source.st_mtime == entry.get("sourceTime"))
+
+	# Returns a buffer of the asset's data, which shares memory with the map.
+	def view(self, path):
+		entry = self.index[path]
+		return buffer(self.map, self.dataStart + entry["offset"], entry["size"])
+
+	def image(self, path):
+		entry = self.index[path]
+		return pygame.image.frombuffer(self.view(path), (entry["width"], entry["height"]),
+									   str(entry["format"]))
+
+	# Returns None if the sound was stored for a mixer set up differently
+	# than the current one, since its samples would play wrong.
+	def sound(self, path):
+		if tuple(self.index[path]["mixer"]) != pygame.mixer.get_init():
+			return None
+		return pygame.mixer.Sound(buffer=self.view(path))
+
+	# Returns a file to load the font from.
+	def fontFile(self, path):
+		return io.BytesIO(self.view(path))
+
+
+def main():
+	pygame.init()
+	pygame.mixer.init() # Set up the same way as the game's mixer.
+	index = buildBundle()
+	print("Bundled %d assets into %s (%d KB)" %
+		  (len(index), bundlePath, os.path.getsize(bundlePath)//1024))
+	pygame.quit()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,313 @@
+import multiprocessing
+import os
+import random
+import numpy
+import pygame
+import project
+import simulate
+import terrain
+
+###############
+# Environment #
+###############
+
+# Wraps the game as an environment for training agents on, like the ones in
+# OpenAI's Gym, without needing Gym itself. reset(seed) starts a game and
+# returns what the agent sees, and step(action) plays an action and returns
+#   (observation, reward, done, info)
+# The game runs headless and as fast as it can, with no window or audio.
+#
+# An action is one of the names in NewMoonEnv.actions, or its index. It's
+# given to the player on the first tick of the step, like a button press,
+# except for the directions, which are held until another direction is
+# given, like the joystick. A list of actions plays them all at once, as in
+# ["Right", "Jump", "Shoot"]. The reward is the score gained over the step,
+# and the game is done when the player dies, the boss is beaten or maxTicks
+# run out, which info["timeLimit"] tells apart.
+#
+# The observation is either the screen, shrunk by a whole factor, as an
+# array of (height, width, 3) bytes, or (height, width) with grayscale, or
+# the game's state as a vector of floats; see stateVector.
+#
+# poolSizes, if given, overrides some of the game's pool sizes, as in
+# {"explosions": 512}; see project.poolSizesArgument.
+
+class NewMoonEnv(object):
+	actions = ["No Direction", "Left", "Right", "Jump", "Jump Released",
+			   "Shoot", "Dash", "Down"]
+	directions = ["No Direction", "Left", "Right"]
+
+	# How many of the nearest of each thing are in the state, and how many
+	# columns of terrain around the player.
+	nearestEnemies = 8
+	nearestBullets = 8
+	terrainBehind = 8
+	terrainAhead = 24
+
+	def __init__(self, observation="state", contour="Plains", frameSkip=4,
+				 maxTicks=5000, scale=4, grayscale=False, hordeSize=0, poolSizes=None):
+		if observation not in ["state", "pixels"]:
+			raise ValueError("observation must be \"state\" or \"pixels\"")
+		os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+		self.observation = observation
+		self.contour = contour
+		self.frameSkip = frameSkip # How many ticks each step plays.
+		self.maxTicks = maxTicks
+		self.scale = scale
+		self.grayscale = grayscale
+		self.seeds = random.Random() # Seeds each game from the seed given to reset.
+
+		self.data = simulate.newMenu(hordeSize, poolSizes)
+		self.data.keyboardMode = False # So the directions are held like the joystick.
+		self.data.waitForTerrain = True # So the same seed always plays out the same.
+		self.small = pygame.Surface((self.data.width/scale, self.data.height/scale))
+		self.observationShape = self.newObservationShape()
+		self.bossSeen = False
+
+	def newObservationShape(self):
+		if self.observation == "state":
+			return (8 + 3*NewMoonEnv.nearestEnemies + 4*NewMoonEnv.nearestBullets + 5 +
+					NewMoonEnv.terrainBehind + NewMoonEnv.terrainAhead,)
+		shape = (self.small.get_height(), self.small.get_width())
+		if self.grayscale == True:
+			return shape
+		return shape + (3,)
+
+	# Starts a new game and returns its first observation. Without a seed, the
+	# next seed follows on from the last one given.
+	def reset(self, seed=None):
+		if seed != None:
+			self.seeds.seed(seed)
+		data = self.data
+		project.initMenu(data)
+		data.seed = self.seeds.randrange(2**31)
+		data.contour = self.contour
+		project.initGame(data)
+		self.bossSeen = False
+		return self.observe()
+
+	def step(self, action):
+		data = self.data
+		if not isinstance(action, (list, tuple)):
+			action = [action]
+		for name in action:
+			if not isinstance(name, basestring):
+				name = NewMoonEnv.actions[name]
+			if name in NewMoonEnv.directions:
+				project.applyAction(data, "Axis " + name)
+			else:
+				project.applyAction(data, name)
+
+		score = data.score
+		done = False
+		for tick in xrange(self.frameSkip):
+			project.updateGame(data)
+			if len(data.finalBoss) > 0:
+				self.bossSeen = True
+			if (data.player.alive == False or data.tick >= self.maxTicks or
+					(self.bossSeen == True and len(data.finalBoss) == 0)):
+				done = True
+				break
+		info = {"tick": data.tick, "score": data.score, "distance": data.cameraAdjustDistance,
+				"hp": data.player.hp, "timeLimit": done and data.player.alive and
+				data.tick >= self.maxTicks}
+		return self.observe(), data.score - score, done, info
+
+	# Stops the game's terrain thread.
+	def close(self):
+		project.stopTerrainProducer(self.data)
+
+	def observe(self):
+		if self.observation == "state":
+			return self.stateVector()
+		return self.pixels()
+
+	# Draws the game and returns the screen, shrunk by the scale.
+	def pixels(self):
+		data = self.data
+		data.surface.beginFrame(project.cameraView(data))
+		project.drawGame(data)
+		pygame.transform.scale(data.surface.surface, self.small.get_size(), self.small)
+		frame = pygame.surfarray.array3d(self.small).transpose(1, 0, 2)
+		if self.grayscale == True:
+			return numpy.dot(frame, [0.299, 0.587, 0.114]).astype(numpy.uint8)
+		return numpy.ascontiguousarray(frame)
+
+	# Returns the state as floats, mostly from -1 to 1. Positions are taken
+	# from the player, in screens. In order, it holds:
+	#   the player: x on the screen, y, dx, dy, health, and whether they are
+	#   on the ground, sliding on a wall and dashing;
+	#   the nearest enemies: x, y, and 1 if there is one;
+	#   the nearest bullets: x, y, direction, and 1 if there is one;
+	#   the boss: 1 if it's rising, 1 if it's there, its x, y and health;
+	#   the terrain: the height of the ground in each column around the
+	#   player, above the player's feet, in screens.
+	def stateVector(self):
+		data = self.data
+		player = data.player
+		width = float(data.width)
+		height = float(data.height)
+		state = [(player.rect.x - data.cameraAdjustDistance)/width, player.rect.y/height,
+				 player.dx/player.topSpeed/player.dashMultiplier,
+				 player.dy/float(player.terminalVelocity), player.hp/10.0,
+				 float(player.isGrounded), float(player.isWallSliding),
+				 float(player.isDashing)]
+		x, y = player.rect.center
+
+		enemies = data.enemies
+		n = len(enemies)
+		state.extend(nearest(enemies.x[:n] + enemies.width/2 - x,
+							 enemies.y[:n] + enemies.height/2 - y,
+							 [], NewMoonEnv.nearestEnemies, width, height))
+		bullets = data.bullets
+		n = len(bullets)
+		direction = numpy.where(bullets.facingLeft[:n], -1.0, 1.0)
+		state.extend(nearest(bullets.x[:n] - x, bullets.y[:n] - y, [direction],
+							 NewMoonEnv.nearestBullets, width, height))
+
+		bosses = data.finalBoss.sprites()
+		if len(bosses) > 0:
+			boss = bosses[0]
+			state.extend([0, 1, (boss.rect.centerx - x)/width,
+						  (boss.rect.centery - y)/height, boss.hp/25.0])
+		else:
+			state.extend([float(data.finalBossBegun), 0, 0, 0, 0])
+
+		state.extend(self.heightmap()/height)
+		return numpy.array(state, dtype=numpy.float32)
+
+	# Returns how many pixels above the player's feet the ground is, in each
+	# column around the player. Columns which aren't generated yet, or have
+	# no ground, are at the bottom of the map.
+	def heightmap(self):
+		data = self.data
+		tileMap = data.map
+		playerCol = data.player.rect.centerx/data.tileSize
+		cols = numpy.arange(playerCol - NewMoonEnv.terrainBehind,
+							playerCol + NewMoonEnv.terrainAhead)
+		held = (cols >= tileMap.firstCol)&(cols < tileMap.endCol)
+		solid = tileMap.cells[:, cols % tileMap.capacity] != terrain.air
+		tops = numpy.where(solid.any(axis=0), solid.argmax(axis=0), tileMap.rows)
+		tops[~held] = tileMap.rows
+		return float(data.player.rect.bottom) - tops*data.tileSize
+
+
+# Returns the x and y of the count nearest of some things, along with their
+# other values and 1 for each, padded with zeros to count things.
+def nearest(dx, dy, values, count, width, height):
+	order = numpy.argsort(dx*dx + dy*dy)[:count]
+	columns = [dx[order]/width, dy[order]/height]
+	for value in values:
+		columns.append(value[order])
+	columns.append(numpy.ones(len(order)))
+	things = numpy.zeros((count, len(columns)))
+	if len(order) > 0:
+		things[:len(order)] = numpy.column_stack(columns)
+	return things.ravel()
+
+
+##########################
+# Vectorized Environment #
+##########################
+
+# Steps a number of environments together, for more samples a second.
+# reset and step take and return one of everything for each environment,
+# stacked into arrays. An environment which is done starts a new game
+# straight away, and its last observation goes in its info, as
+# info["finalObservation"]. The environments take the same options as
+# NewMoonEnv, and are seeded one after another from the seed given to reset.
+class VectorEnv(object):
+	def __init__(self, count, **options):
+		self.envs = [NewMoonEnv(**options) for i in xrange(count)]
+		self.observationShape = self.envs[0].observationShape
+
+	def __len__(self):
+		return len(self.envs)
+
+	def reset(self, seed=None):
+		return numpy.stack([self.envs[i].reset(envSeed(seed, i))
+							for i in xrange(len(self.envs))])
+
+	def step(self, actions):
+		return stackSteps([stepOrReset(self.envs[i], actions[i])
+						   for i in xrange(len(self.envs))])
+
+	def close(self):
+		for env in self.envs:
+			env.close()
+
+
+# The same, with each environment in a process of its own, for when one
+# core isn't enough. Each step is sent to every process before waiting on
+# any of them, so they all run at once.
+class SubprocessVectorEnv(object):
+	def __init__(self, count, **options):
+		self.pipes = []
+		self.processes = []
+		for i in xrange(count):
+			pipe, workerPipe = multiprocessing.Pipe()
+			process = multiprocessing.Process(target=runWorker, args=(workerPipe, options))
+			process.daemon = True
+			process.start()
+			workerPipe.close()
+			self.pipes.append(pipe)
+			self.processes.append(process)
+		self.pipes[0].send(("shape", None))
+		self.observationShape = self.pipes[0].recv()
+
+	def __len__(self):
+		return len(self.pipes)
+
+	def reset(self, seed=None):
+		for i in xrange(len(self.pipes)):
+			self.pipes[i].send(("reset", envSeed(seed, i)))
+		return numpy.stack([pipe.recv() for pipe in self.pipes])
+
+	def step(self, actions):
+		for i in xrange(len(self.pipes)):
+			self.pipes[i].send(("step", actions[i]))
+		return stackSteps([pipe.recv() for pipe in self.pipes])
+
+	def close(self):
+		for pipe in self.pipes:
+			pipe.send(("close", None))
+		for process in self.processes:
+			process.join()
+
+
+def envSeed(seed, i):
+	if seed == None:
+		return None
+	return seed + i
+
+
+# Steps an environment, and starts a new game if that one is done.
+def stepOrReset(env, action):
+	observation, reward, done, info = env.step(action)
+	if done == True:
+		info["finalObservation"] = observation
+		observation = env.reset()
+	return observation, reward, done, info
+
+
+def stackSteps(steps):
+	observations, rewards, dones, infos = zip(*steps)
+	return (numpy.stack(observations), numpy.array(rewards, dtype=numpy.float32),
+			numpy.array(dones), list(infos))
+
+
+# Runs one environment in a worker process, doing what the pipe asks.
+def runWorker(pipe, options):
+	env = NewMoonEnv(**options)
+	while True:
+		command, argument = pipe.recv()
+		if command == "step":
+			pipe.send(stepOrReset(env, argument))
+		elif command == "reset":
+			pipe.send(env.reset(argument))
+		elif command == "shape":
+			pipe.send(env.observationShape)
+		elif command == "close":
+			env.close()
+			pipe.close()
+			return
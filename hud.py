@@ -0,0 +1,149 @@
+import collections
+import pygame
+
+################
+# Text Drawing #
+################
+
+# Returns a clear surface with the pixel format of image. Images copied onto
+# it draw exactly the same pixels as they would have drawn themselves.
+def clearSurfaceLike(image, size):
+	return pygame.Surface(size, pygame.SRCALPHA, image.get_bitsize(),
+						  image.get_masks())
+
+
+# Copies an image, or the area of it given, onto a clear surface without
+# blending it.
+def copyOnto(surface, image, position, area=None):
+	surface.blit(image, position, area, pygame.BLEND_RGBA_MAX)
+
+
+# Keeps the surfaces of the strings which were rendered most recently, so
+# text which is drawn every frame is only rasterized once. Surfaces are
+# kept by (font, string, colour), and the one used longest ago is dropped
+# when there are more than capacity of them.
+class TextCache(object):
+	def __init__(self, capacity=64):
+		self.capacity = capacity
+		self.surfaces = collections.OrderedDict()
+
+	def render(self, font, string, color):
+		key = (font, string, tuple(color))
+		surface = self.surfaces.pop(key, None)
+		if surface is None:
+			surface = font.render(string, 1, color)
+			if len(self.surfaces) >= self.capacity:
+				self.surfaces.popitem(last=False)
+		self.surfaces[key] = surface # Now the most recently used.
+		return surface
+
+
+# The printable ASCII characters.
+asciiCharacters = "".join([chr(code) for code in xrange(32, 127)])
+
+# Every character of a monospace font, rendered once into a row of cells
+# on one sheet. Strings are put together by copying their characters'
+# cells, which gives the same pixels as rendering the whole string with
+# the font, without rasterizing anything.
+class GlyphAtlas(object):
+	def __init__(self, font, color, characters=asciiCharacters):
+		self.cellWidth, self.cellHeight = font.size(characters[0])
+		for character in characters:
+			if font.size(character) != (self.cellWidth, self.cellHeight):
+				raise ValueError("the glyph atlas needs a monospace font")
+
+		glyphs = []
+		for character in characters:
+			glyphs.append(font.render(character, 1, color))
+		self.sheet = clearSurfaceLike(glyphs[0],
+									  (self.cellWidth*len(characters), self.cellHeight))
+		self.cells = {} # Maps a character to its cell on the sheet.
+		for i in xrange(len(characters)):
+			cell = pygame.Rect(i*self.cellWidth, 0, self.cellWidth, self.cellHeight)
+			copyOnto(self.sheet, glyphs[i], cell.topleft)
+			self.cells[characters[i]] = cell
+
+	def size(self, string):
+		return (self.cellWidth*len(string), self.cellHeight)
+
+	# Copies a string's glyphs onto a clear surface made by clearSurface.
+	def copyOnto(self, surface, string, position):
+		x, y = position
+		for character in string:
+			copyOnto(surface, self.sheet, (x, y), self.cells[character])
+			x += self.cellWidth
+
+	# Returns a clear surface in the atlas's pixel format.
+	def clearSurface(self, size):
+		return clearSurfaceLike(self.sheet, size)
+
+	def render(self, string):
+		surface = self.clearSurface(self.size(string))
+		self.copyOnto(surface, string, (0, 0))
+		return surface
+
+
+#######
+# HUD #
+#######
+
+# Draws the health bars, the score and the pause message over the game.
+# Each one is kept as a finished surface which is only rendered again when
+# what it shows has changed, so a frame where nothing changed just blits
+# each element once.
+class Hud(object):
+	def __init__(self, font, heartImages, spacing, color=(255,255,255)):
+		self.glyphs = GlyphAtlas(font, color)
+		self.heartImages = heartImages # The heart image for each player number.
+		self.spacing = spacing # The distance between hearts and between lines.
+
+		self.healthBars = {} # Maps a player number to its (hp, surface).
+		self.scoreOverlay = (None, None) # The (score, surface) last shown.
+		self.pauseOverlay = self.glyphs.render("PAUSED")
+
+	# Returns a surface holding a row of hp hearts in the player's colour.
+	def healthBar(self, playerNumber, hp):
+		shownHp, bar = self.healthBars.get(playerNumber, (None, None))
+		if hp != shownHp:
+			heart = self.heartImages[playerNumber]
+			hearts = max(hp, 0)
+			width = max(self.spacing*(hearts-1) + heart.get_width(), 0)
+			bar = clearSurfaceLike(heart, (width, heart.get_height()))
+			for i in xrange(hearts):
+				copyOnto(bar, heart, (i*self.spacing, 0))
+			self.healthBars[playerNumber] = (hp, bar)
+		return bar
+
+	# Draws a player's health bar with its first heart centered on center.
+	def drawHealth(self, surface, playerNumber, hp, center):
+		heart = self.heartImages[playerNumber]
+		position = (center[0] - heart.get_width()/2, center[1] - heart.get_height()/2)
+		surface.blit(self.healthBar(playerNumber, hp), position)
+
+	# Returns a surface holding the final score, with the high score on the
+	# line below it, shifted two lines to the left. The lines are put
+	# together from the glyph atlas, since the score can change every frame.
+	def scoreSurface(self, score):
+		shownScore, overlay = self.scoreOverlay
+		if score != shownScore:
+			scoreLine = ("Score: %d") % score
+			highScoreLine = ("HighScore: %d") % score
+			width = max(self.glyphs.size(scoreLine)[0] + 2*self.spacing,
+						self.glyphs.size(highScoreLine)[0])
+			height = self.spacing + self.glyphs.cellHeight
+			if overlay is not None and overlay.get_size() == (width, height):
+				overlay.fill((0,0,0,0))
+			else:
+				overlay = self.glyphs.clearSurface((width, height))
+			self.glyphs.copyOnto(overlay, scoreLine, (2*self.spacing, 0))
+			self.glyphs.copyOnto(overlay, highScoreLine, (0, self.spacing))
+			self.scoreOverlay = (score, overlay)
+		return overlay
+
+	# Draws the score with its first line at position.
+	def drawScore(self, surface, score, position):
+		surface.blit(self.scoreSurface(score),
+					 (position[0] - 2*self.spacing, position[1]))
+
+	def drawPause(self, surface, position):
+		surface.blit(self.pauseOverlay, position)
@@ -0,0 +1,136 @@
+import numpy
+import slots
+
+####################
+# Particle Effects #
+####################
+
+# A kind of particle: the images it animates through, each shown for
+# frameDuration + 1 ticks, and the sound it makes when it's emitted. However
+# many are emitted at once, the sound plays at most once every
+# soundInterval ticks.
+class ParticleKind(object):
+	def __init__(self, images, frameDuration, sound=None, soundInterval=0):
+		self.images = images
+		self.frameDuration = frameDuration
+		self.sound = sound
+		self.soundInterval = soundInterval
+		self.soundCooldown = 0
+		# Particles are placed by their first image's center, and the later
+		# images are drawn from the same top left corner.
+		self.halfWidth, self.halfHeight = images[0].get_width()/2, images[0].get_height()/2
+
+
+# Holds every particle in the game as parallel arrays instead of sprites, like
+# the bullets and enemies. Particles don't move; each one only counts down
+# its frame's timer and moves on to its next image, so a tick advances them
+# all at once. Unlike the other slots, these never grow: once they're all in
+# use, new particles are dropped, and counted.
+class ParticleSystem(slots.PackedSlots):
+	fields = [("x", numpy.int32), ("y", numpy.int32), ("kind", numpy.int32),
+			  ("frame", numpy.int32), ("timer", numpy.int32)]
+
+	def __init__(self, kinds, capacity=256):
+		self.kinds = [] # The kinds, by their index in the arrays.
+		self.kindIndex = {} # Maps a kind's name to its index.
+		for name in sorted(kinds):
+			self.kindIndex[name] = len(self.kinds)
+			self.kinds.append(kinds[name])
+		self.emitters = []
+		slots.PackedSlots.__init__(self, capacity)
+		self.dropped = 0 # How many were emitted while every slot was in use.
+		self.frameCount = numpy.array([len(kind.images) for kind in self.kinds])
+		self.frameDuration = numpy.array([kind.frameDuration for kind in self.kinds])
+
+	# Starts a particle of the named kind centered on (x, y). Returns False if
+	# it was dropped because every slot is in use.
+	def emit(self, name, x, y, playSound=True):
+		if self.count == self.capacity():
+			self.dropped += 1
+			return False
+		kind = self.kinds[self.kindIndex[name]]
+		if playSound == True and kind.sound != None and kind.soundCooldown == 0:
+			kind.sound.play()
+			kind.soundCooldown = kind.soundInterval
+		i = self.add()
+		self.x[i] = x - kind.halfWidth
+		self.y[i] = y - kind.halfHeight
+		self.kind[i] = self.kindIndex[name]
+		self.frame[i] = 0
+		self.timer[i] = kind.frameDuration
+		return True
+
+	def addEmitter(self, emitter):
+		self.emitters.append(emitter)
+
+	# Advances every particle by one tick, after letting the emitters emit,
+	# and drops the particles which have run through all their images.
+	def update(self):
+		for kind in self.kinds:
+			if kind.soundCooldown > 0:
+				kind.soundCooldown -= 1
+		emitters = []
+		for emitter in self.emitters:
+			if emitter.update(self) == True:
+				emitters.append(emitter)
+		self.emitters = emitters
+
+		n = self.count
+		timer, frame, kind = self.timer[:n], self.frame[:n], self.kind[:n]
+		expired = timer == 0
+		timer -= 1
+		frame[expired] += 1
+		timer[expired] = self.frameDuration[kind[expired]]
+		self.keepOnly(frame < self.frameCount[kind])
+
+	def clear(self):
+		slots.PackedSlots.clear(self)
+		self.emitters = []
+
+	# Draws the particles, shifted by the camera, one image at a time.
+	def draw(self, surface, camera):
+		n = self.count
+		x = self.x[:n] - camera
+		y = self.y[:n]
+		for k in xrange(len(self.kinds)):
+			images = self.kinds[k].images
+			ofKind = self.kind[:n] == k
+			for f in xrange(len(images)):
+				for i in numpy.flatnonzero(ofKind & (self.frame[:n] == f)):
+					surface.blit(images[f], (x[i], y[i]))
+
+
+# Emits particles of a kind around a point for a while: after delay ticks,
+# perTick of them every tick, each up to spread pixels away in x and in y,
+# until duration ticks have passed. Then it calls finished, if it's given.
+class Emitter(object):
+	def __init__(self, name, x, y, spread, perTick, delay, duration, random,
+				 playSound=False, finished=None):
+		self.name = name
+		self.x = x
+		self.y = y
+		self.spread = spread
+		self.perTick = perTick
+		self.delay = delay
+		self.duration = duration
+		self.random = random # The random stream the offsets are drawn from.
+		self.playSound = playSound
+		self.finished = finished
+
+	# Returns False once it's done.
+	def update(self, particles):
+		self.duration -= 1
+		if self.delay > 0:
+			self.delay -= 1
+		else:
+			for i in xrange(self.perTick):
+				xSign = self.random.choice([-1, 1])
+				ySign = self.random.choice([-1, 1])
+				x = self.x + xSign*self.random.randint(0, self.spread)
+				y = self.y + ySign*self.random.randint(0, self.spread)
+				particles.emit(self.name, x, y, self.playSound)
+		if self.duration == 0:
+			if self.finished != None:
+				self.finished()
+			return False
+		return True
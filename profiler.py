@@ -0,0 +1,125 @@
+import collections
+import time
+import pygame
+import hud
+
+############
+# Profiler #
+############
+
+# Times each phase of every frame, so a stutter can be traced to the part
+# of the game behind it. Phases are timed as laps: start starts the clock,
+# and each lap ends the phase which began at the last start or lap. While
+# the profiler is off every call returns straight away, so the laps can be
+# left in the game loop.
+class FrameProfiler(object):
+	def __init__(self, history=120):
+		self.enabled = False
+		self.history = history # How many of the last times are kept.
+		self.times = collections.OrderedDict() # Maps a phase to its last times in ms.
+		self.frameTimes = collections.deque(maxlen=history)
+		self.lapStart = None
+		self.frameStart = None
+
+	def toggle(self):
+		self.enabled = not self.enabled
+		self.times.clear()
+		self.frameTimes.clear()
+		self.frameStart = None
+
+	def start(self):
+		if self.enabled:
+			self.lapStart = time.time()
+
+	def lap(self, name):
+		if self.enabled:
+			now = time.time()
+			if name not in self.times:
+				self.times[name] = collections.deque(maxlen=self.history)
+			self.times[name].append(1000*(now - self.lapStart))
+			self.lapStart = now
+
+	# Records the time since the last frame ended.
+	def endFrame(self):
+		if self.enabled:
+			now = time.time()
+			if self.frameStart != None:
+				self.frameTimes.append(1000*(now - self.frameStart))
+			self.frameStart = now
+
+	# Returns (phase, average ms) for every phase timed so far.
+	def averages(self):
+		averages = []
+		for name in self.times:
+			times = self.times[name]
+			averages.append((name, sum(times)/len(times)))
+		return averages
+
+	def averageFrameTime(self):
+		if len(self.frameTimes) == 0:
+			return 0
+		return sum(self.frameTimes)/len(self.frameTimes)
+
+
+# Draws a profiler's averages, a graph of the last frames' times and counts
+# of what's in the game. The text only changes every refreshInterval frames,
+# so it can be read, and is kept as a surface in between.
+class ProfilerOverlay(object):
+	refreshInterval = 15
+	graphHeight = 48
+	graphScale = 2.0 # Pixels of graph per millisecond.
+	background = (24, 24, 24)
+
+	def __init__(self, profiler, font, color=(255,255,0)):
+		self.profiler = profiler
+		self.glyphs = hud.GlyphAtlas(font, color)
+		self.color = color
+		self.panel = None
+		self.framesUntilRefresh = 0
+
+	# Returns a surface with the lines of text on a dark background.
+	def renderPanel(self, counts):
+		frameTime = self.profiler.averageFrameTime()
+		lines = []
+		if frameTime > 0:
+			lines.append("frame %6.2f ms %4d fps" % (frameTime, 1000/frameTime))
+		for name, milliseconds in self.profiler.averages():
+			lines.append("%-15s %6.2f ms" % (name, milliseconds))
+		for name, count in counts:
+			lines.append("%-15s %6d" % (name, count))
+
+		glyphs = self.glyphs
+		width = max(len(line) for line in lines)*glyphs.cellWidth
+		panel = pygame.Surface((width, len(lines)*glyphs.cellHeight))
+		panel.fill(ProfilerOverlay.background)
+		for i in xrange(len(lines)):
+			for j in xrange(len(lines[i])):
+				panel.blit(glyphs.sheet, (j*glyphs.cellWidth, i*glyphs.cellHeight),
+						   glyphs.cells[lines[i][j]])
+		return panel
+
+	# Draws the last frames' times as bars, oldest first, with a line at the
+	# time of a frame at 60 frames a second.
+	def drawGraph(self, surface, position):
+		x, y = position
+		width = self.profiler.history
+		height = ProfilerOverlay.graphHeight
+		surface.fill(ProfilerOverlay.background, (x, y, width, height))
+		for frameTime in self.profiler.frameTimes:
+			barHeight = min(int(frameTime*ProfilerOverlay.graphScale), height)
+			surface.fill(self.color, (x, y + height - barHeight, 1, barHeight))
+			x += 1
+		targetY = y + height - int(1000/60.0*ProfilerOverlay.graphScale)
+		surface.fill((255, 0, 0), (position[0], targetY, width, 1))
+
+	# Draws the overlay with its top right corner at position. Counts is a
+	# list of (name, count) of the things in the game.
+	def draw(self, surface, counts, position):
+		if self.framesUntilRefresh == 0 or self.panel == None:
+			self.panel = self.renderPanel(counts)
+			self.framesUntilRefresh = ProfilerOverlay.refreshInterval
+		self.framesUntilRefresh -= 1
+		right, top = position
+		surface.blit(self.panel, (right - self.panel.get_width(), top))
+		self.drawGraph(surface, (right - self.profiler.history,
+								 top + self.panel.get_height()))
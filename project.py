@@ -1,7 +1,21 @@
 import pygame, sys
+import os
 from pygame.locals import *
 import math
 import random
+import numpy
+import assets
+import bundle
+import bullets
+import hud
+import particles
+import profiler
+import replay
+import screen
+import spatial
+import swarm
+import terrain
+import timestep
 
 ####################
 # Helper Functions #
@@ -19,82 +33,127 @@ def sameSign(a, b):
 		return 0
 
 
+#################
+# Asset Loading #
+#################
+
+# Every image and sound is loaded by the registry the first time it is used,
+# so importing the game doesn't load anything.
+assetRegistry = assets.AssetRegistry()
+
+# Returns the image in the images folder with the given name.
+def image(name):
+	return assetRegistry.image("images/%s.png" % name)
+
+# The small images, which the preload packs into one texture atlas, and the
+# large ones, which it loads by themselves.
+atlasImageNames = ["robotFacingLeft", "robotFacingRight", "red",
+				   "shotFacingRight", "shotFacingLeft", "green", "brown",
+				   "blueHeart", "orangeHeart",
+				   "phaseZero", "phaseOne", "phaseTwo", "phaseThree",
+				   "phaseFour", "phaseFive", "phaseSix", "phaseSeven",
+				   "expZero", "expOne", "expTwo", "expThree"]
+largeImageNames = ["bigMoon", "moonExp0", "moonExp1", "moonExp2"]
+
+# Starts loading every image and sound on a worker thread, so they are ready
+# by the time they are needed. The display mode has to be set first.
+def preloadAssets(data):
+	paths = []
+	for name in atlasImageNames + largeImageNames:
+		paths.append("images/%s.png" % name)
+	sounds = []
+	for sound in data.sounds:
+		sounds.append((sound.path, sound.volume))
+	assetRegistry.preload(paths, sounds, paths[:len(atlasImageNames)])
+
+
 ########################
 # Random Map Generator #
 ########################
 
-# Generates a 2d list which contains information about the map.
-# Different contours make the map more varied.
-def generateRandomMap(data):
-	data.map = []
-	for row in xrange(data.rows): data.map += [[0]*data.cols]
-	middleRow = (data.lowestRow+data.highestRow)/2 # The starting point for the map.
-
-	# Defining the tile types
-	air = 0
-	ground = 1
-
-	generateLandscape(data, (middleRow, 0))	# Create the top landscape
-	fillGround(data, data.cols)				# Fill in the underground
-
-
-# Given a map and the tile to begin with, generates  
-# a random landscape until the last col of the map.
-def generateLandscape(data, cell):
-	# Defining the chances
-	if data.contour == "Mountains":
-		chances = (.4, .8)
-	elif data.contour == "Hills":
-		chances = (.3, .6)
-	else:
-		chances = (.2, .4)
-
-	row,col = cell
-	while col <= len(data.map[0])-1:
-		data.map[row][col] = 1 # Set the cell to be a surface.
-		xPosition = col*data.tileSize - data.cameraAdjustDistance
-		yPosition = row*data.tileSize
-		Ground(xPosition, yPosition).add(data.terrain)
-
-		randomValue = random.randint(0,10)*.1 # This float determines direction.
-
-		if randomValue <= chances[0] and row < data.lowestRow:
-			row += 1 # down
-		elif randomValue <= chances[1] and row > data.highestRow:
-			row -= 1 # up
-		else:
-			col += 1 # horizontal
-
-
-def createNewCols(data, colsToAdd):
-	lastCol = len(data.map[0]) - 1
-	for row in xrange(len(data.map)):
-		if data.map[row][lastCol] == 1:
-			surfaceRow = row
-
-	for row in xrange(len(data.map)):
-		data.map[row] += [0]*colsToAdd
-
-	if len(data.map[0])%20 == 0 and data.inMenu == False:
-		spawnJumperEnemyOffScreen(data)
-
-	generateLandscape(data, (surfaceRow,lastCol))
-
-	fillGround(data, colsToAdd)
-
+# Generates the tile map which contains information about the map.
+# Different contours make the map more varied. The same seed and contour
+# always generate the same map. The columns are generated ahead on a
+# worker thread by the terrain producer.
+def generateRandomMap(data, seed=None):
+	if seed == None:
+		seed = random.randrange(2**31)
 
-def fillGround(data, colsToFill):
-	for col in xrange(len(data.map[0])-colsToFill, len(data.map[0])):
-		xPosition = col*data.tileSize - data.cameraAdjustDistance
-		placeUnderGroundTile = False
-		for row in xrange(len(data.map)):
-			yPosition = row*data.tileSize
-			if data.map[row][col] == 1:
-				placeUnderGroundTile = True
-			elif data.map[row][col] == 0:
-				if placeUnderGroundTile == True:
-					data.map[row][col] = 2
-					Underground(xPosition, yPosition).add(data.underground)
+	data.map = terrain.TileMap(data.rows, data.mapCapacity)
+	data.chunks = terrain.ChunkCache(data.rows, data.tileSize, data.chunkCols)
+	middleRow = (data.lowestRow+data.highestRow)/2 # The starting point for the map.
+	generator = terrain.TerrainGenerator(data.contour, seed,
+						data.highestRow, data.lowestRow, middleRow)
+
+	stopTerrainProducer(data)
+	data.terrainProducer = terrain.TerrainProducer(generator, data.rows,
+										data.tileSize, tileImages(), 2*data.mapMargin)
+	data.terrainProducer.start()
+
+	for col in xrange(data.cols):
+		placeColumn(data, data.terrainProducer.take())
+
+
+def stopTerrainProducer(data):
+	if getattr(data, "terrainProducer", None) != None:
+		data.terrainProducer.stop()
+		data.terrainProducer = None
+
+
+# Adds columns from the terrain producer to the right side of the map.
+# If block is False, only the columns which are ready are added.
+def createNewCols(data, colsToAdd, block=True):
+	for i in xrange(colsToAdd):
+		column = data.terrainProducer.take(block)
+		if column == None:
+			return
+		placeColumn(data, column)
+
+		if data.map.endCol%20 == 0 and data.inMenu == False:
+			spawnJumperEnemyOffScreen(data)
+
+
+# Fills in a column's surface and underground, and bakes its tiles.
+def placeColumn(data, column):
+	col, top, bottom, strip = column
+	data.map.addColumns(1)
+	data.map.setColumn(col, top, bottom)
+	data.chunks.bakeColumn(col, strip)
+
+
+# Keeps the map generated a margin ahead of the right side of the screen.
+# One column is added per frame if the producer has one ready. The frame
+# only waits for the producer if the screen is about to run out of map, or
+# always if data.waitForTerrain is True, so a run with the same seeds and
+# input always plays out the same.
+def extendMap(data):
+	mapRight = data.map.endCol*data.tileSize - data.cameraAdjustDistance
+	if mapRight < data.width + data.mapMargin*data.tileSize:
+		createNewCols(data, 1, data.waitForTerrain or mapRight < data.width + data.tileSize)
+
+
+# Returns the rects of the surface tiles which a rect overlaps.
+# They are worked out straight from the tile grid, so only the few cells
+# under the rect are tested.
+def terrainCollisions(data, rect):
+	cells = data.map.cellsInBox(rect.left, rect.top, rect.right, rect.bottom,
+								data.tileSize, terrain.ground)
+	tiles = []
+	for row, col in cells:
+		tiles.append(pygame.Rect(col*data.tileSize, row*data.tileSize,
+								 data.tileSize, data.tileSize))
+	return tiles
+
+
+# Drops the columns which have scrolled off the left side of the screen,
+# in the order they were created, along with the chunks they filled.
+def expireOldCols(data):
+	while data.map.firstCol < data.map.endCol:
+		colRight = (data.map.firstCol+1)*data.tileSize - data.cameraAdjustDistance
+		if colRight >= -data.rumblePower:
+			break
+		data.map.expireColumn()
+	data.chunks.evictBefore(data.map.firstCol)
 
 
 #####################
@@ -139,14 +198,13 @@ class PhysicalObject(pygame.sprite.Sprite):
 
 # This class contains the information about the player.
 class Player(PhysicalObject):
-	playerFacingLeft = pygame.image.load("images/robotFacingLeft.png")
-	playerFacingRight = pygame.image.load("images/robotFacingRight.png")
-	playerStanding = pygame.image.load("images/robotStanding.png")
+	playerFacingLeft = "robotFacingLeft"
+	playerFacingRight = "robotFacingRight"
 
 	def __init__(self, x, y):
 		# Create Sprite
 		pygame.sprite.Sprite.__init__(self)
-		self.image = Player.playerFacingRight
+		self.image = image(Player.playerFacingRight)
 		self.rect = self.image.get_rect()
 		self.rect.x = x
 		self.rect.y = y
@@ -200,9 +258,9 @@ class Player(PhysicalObject):
 
 	def setDirection(self):
 		if self.playerDirection == "Right":
-			self.image = Player.playerFacingRight
+			self.image = image(Player.playerFacingRight)
 		else:
-			self.image = Player.playerFacingLeft
+			self.image = image(Player.playerFacingLeft)
 
 	# Called in the player's update function.
 	# Changes the player's movement and position.
@@ -212,14 +270,14 @@ class Player(PhysicalObject):
 
 	# Resolves the collisions for a player.
 	def playerCollisions(self, data):
-		# Checks for collision between the player and the sprites in the terrain group.
+		# Checks for collision between the player and the surface tiles it overlaps.
 		collided = False
-		for collision in pygame.sprite.spritecollide(self, data.terrain, False):
+		for tile in terrainCollisions(data, self.rect):
 			collided = True
-			ceilingDistance = abs(collision.rect.bottom - self.rect.top)
-			groundDistance = abs(collision.rect.top - self.rect.bottom)
-			rightWallDistance = abs(collision.rect.right - self.rect.left)
-			leftWallDistance = abs(collision.rect.left - self.rect.right)
+			ceilingDistance = abs(tile.bottom - self.rect.top)
+			groundDistance = abs(tile.top - self.rect.bottom)
+			rightWallDistance = abs(tile.right - self.rect.left)
+			leftWallDistance = abs(tile.left - self.rect.right)
 
 			# The minimum among these distances will partly determine the collision.
 			lowToHigh = sorted([ceilingDistance] + [groundDistance] +
@@ -234,44 +292,34 @@ class Player(PhysicalObject):
 			if cornerHit == False:
 				# Now we compare and decide.
 				if rightWallDistance == lowToHigh[0]:
-					self.rect.left = collision.rect.right
+					self.rect.left = tile.right
 					self.hitWall("Right")
 				elif leftWallDistance == lowToHigh[0]:
-					self.rect.right = collision.rect.left
+					self.rect.right = tile.left
 					self.hitWall("Left")
 				elif (groundDistance == lowToHigh[0] or groundDistance < abs(self.dy)):
-					self.rect.bottom = collision.rect.top + 1
+					self.rect.bottom = tile.top + 1
 					self.hitFloor()
 				else:
-					self.rect.top = collision.rect.bottom
+					self.rect.top = tile.bottom
 					self.hitCeiling()
 		if collided == False:
 			self.isGrounded = False
 			self.isWallSliding = False
 
-		if self.rect.left < 0 or self.rect.right > data.width:
+		if (self.rect.left < data.cameraAdjustDistance or
+			self.rect.right > data.cameraAdjustDistance + data.width):
 			self.hitBoundary(data)
 
+	# Scrolls the camera so the player never passes the scroll point.
+	# Sprites live in world coordinates, so only the camera moves.
 	def adjustCamera(self, data):
 		if data.cameraLock == False:
-			if self.rect.right > data.cameraScrollPoint:
-				adjustment = data.cameraScrollPoint - self.rect.right
-				for sprite in data.terrain:
-					sprite.rect.move_ip(adjustment, 0)
-				for sprite in data.underground:
-					sprite.rect.move_ip(adjustment, 0)
-				for sprite in data.players:
-					sprite.rect.move_ip(adjustment, 0)
-				for sprite in data.bullets:
-					sprite.rect.move_ip(adjustment, 0)
-				for sprite in data.enemies:
-					sprite.rect.move_ip(adjustment, 0)
-				for sprite in data.finalBoss:
-					sprite.rect.move_ip(adjustment, 0)
-				for sprite in data.explosions:
-					sprite.rect.move_ip(adjustment, 0)
-				data.cameraAdjustDistance += abs(adjustment)
-				data.score += abs(adjustment)
+			screenRight = self.rect.right - data.cameraAdjustDistance
+			if screenRight > data.cameraScrollPoint:
+				adjustment = screenRight - data.cameraScrollPoint
+				data.cameraAdjustDistance += adjustment
+				data.score += adjustment
 
 	def groundCollideCooldown(self):
 		if self.hasCollidedWithGroundCooldown > 0:
@@ -308,8 +356,8 @@ class Player(PhysicalObject):
 			self.alive = False
 			if len(data.players.sprites()) == 1:
 				data.displayScore = True
-			data.explosions.add(Explosion(self.rect.centerx, self.rect.centery))
-			pygame.mixer.Sound.play(data.deathSound)
+			explode(data, self.rect.centerx, self.rect.centery)
+			data.deathSound.play()
 			self.remove(data.players)
 
 	def stunCooldownFn(self):
@@ -344,13 +392,13 @@ class Player(PhysicalObject):
 	def jump(self, data):
 		# If the player is on the ground, do a normal jump.
 		if self.isGrounded == True:
-			pygame.mixer.Sound.play(data.jumpSound2)
+			data.jumpSound2.play()
 			self.dy = -self.jumpPower
 			self.isGrounded = False
 			self.secondJumpAvailable = True
 		# If the player is sliding on a wall, jump some degrees above the horizontal.
 		elif self.isWallJumpAvailable == True:
-			pygame.mixer.Sound.play(data.jumpSound2)
+			data.jumpSound2.play()
 			self.dy = -self.jumpPower*math.sin(self.wallJumpAngle)
 			if self.wallSlide == "Right":
 				self.dx = self.jumpPower*math.cos(self.wallJumpAngle)
@@ -361,7 +409,7 @@ class Player(PhysicalObject):
 			self.isWallJumpAvailable = False
 		# If the player is in the air, do another normal jump straight up.
 		elif self.secondJumpAvailable == True:
-			pygame.mixer.Sound.play(data.jumpSound)
+			data.jumpSound.play()
 			self.dy = -self.jumpPower
 			self.secondJumpAvailable = False
 
@@ -408,10 +456,10 @@ class Player(PhysicalObject):
 
 	def hitBoundary(self, data):
 		self.dx = 0
-		if self.rect.left <= 0:
-			self.rect.left = 1
-		elif self.rect.right >= data.width:
-			self.rect.right = data.width - 1
+		if self.rect.left <= data.cameraAdjustDistance:
+			self.rect.left = data.cameraAdjustDistance + 1
+		elif self.rect.right >= data.cameraAdjustDistance + data.width:
+			self.rect.right = data.cameraAdjustDistance + data.width - 1
 
 	def move(self, direction):
 		if direction == "Left":
@@ -442,8 +490,8 @@ class Player(PhysicalObject):
 
 	def shoot(self, data):
 		if self.alive == True:
-			data.bullets.add(Bullet(self.rect.centerx, self.rect.centery-9,
-								 	self.playerDirection, self.dx, data))
+			data.bullets.spawn(self.rect.centerx, self.rect.centery-9,
+							   self.playerDirection, self.dx)
 
 	# Player controls and effects on movement.
 	def control(self, event, data):
@@ -485,107 +533,48 @@ class Player(PhysicalObject):
 		elif event == "Pause":
 			if data.paused == True:
 				data.paused = False
-				pygame.mixer.unpause()
+				assets.unpauseAll()
 			else:
-				pygame.mixer.pause()
-				pygame.mixer.Sound.play(data.pauseSound)
+				assets.pauseAll()
+				data.pauseSound.play()
 				data.paused = True
 
 
-class Bullet(pygame.sprite.Sprite):
-	bulletImageRight = pygame.image.load("images/shotFacingRight.png")
-	bulletImageLeft = pygame.image.load("images/shotFacingLeft.png")
-
-	def __init__(self, x_location, y_location, direction, additionalSpeed, data):
-		pygame.sprite.Sprite.__init__(self)
-
-		# Constants
-		bulletSpeed = 20
-
-		# Properties
-		if direction == "Right":
-			self.direction = "Right"
-			self.dx = bulletSpeed + additionalSpeed
-			self.image = Bullet.bulletImageRight
-		else:
-			self.direction = "Left"
-			self.dx = -bulletSpeed + additionalSpeed
-			self.image = Bullet.bulletImageLeft
-
-		self.dy = 0
-		self.rect = self.image.get_rect()
-		self.rect.x = x_location
-		self.rect.y = y_location
-
-
-	def update(self, data):
-		# Movement
-		self.rect.move_ip(self.dx, self.dy)
-
-		# Check for collisions
-		self.collisions(data)
-
-		# Check if bullet is off screen
-		if self.rect.x < 0 or self.rect.x > data.width:
-			self.remove(data.bullets)
-
-
-	def collisions(self, data):
-		# A collision with the terrain will cause the bullets to disappear.
-		pygame.sprite.groupcollide(data.bullets, data.terrain, True, False)
-
-
-class Ground(pygame.sprite.Sprite):
-	tileImage = pygame.image.load("images/green.png")
-
-	def __init__(self, x_location, y_location):
-		pygame.sprite.Sprite.__init__(self)
+# The images of the bullets. Bullets aren't sprites; they are kept in
+# arrays by the bullet system.
+def bulletImages():
+	images = {}
+	images["Right"] = image("shotFacingRight")
+	images["Left"] = image("shotFacingLeft")
+	return images
 
-		self.image = Ground.tileImage
-		self.rect = self.image.get_rect()
-
-		self.rect.x = x_location
-		self.rect.y = y_location
-
-	def update(self, data):
-		if self.rect.right < -data.rumblePower:
-			self.remove(data.terrain)
-
-
-class Underground(pygame.sprite.Sprite):
-	tileImage = pygame.image.load("images/brown.png")
-
-	def __init__(self, x_location, y_location):
-		pygame.sprite.Sprite.__init__(self)
-
-		self.image = Underground.tileImage
-		self.rect = self.image.get_rect()
-
-		self.rect.x = x_location
-		self.rect.y = y_location
 
-	def update(self, data):
-		if self.rect.right < -data.rumblePower:
-			self.remove(data.underground)
+# The images of the terrain tiles. Tiles aren't sprites; they are baked
+# into the terrain chunks as the map is generated.
+def tileImages():
+	images = {}
+	images[terrain.ground] = image("green")
+	images[terrain.underground] = image("brown")
+	return images
 
 
 # The moon is the timer of the game, like a game event. When the timer becomes
 # zero, the final boss appears.
 class Moon(pygame.sprite.Sprite):
 	phaseImage = [0,0,0,0,0,0,0,0]
-	phaseImage[0] = pygame.image.load("images/phaseZero.png") # Full Moon
-	phaseImage[1] = pygame.image.load("images/phaseOne.png") # Begin waning
-	phaseImage[2] = pygame.image.load("images/phaseTwo.png")
-	phaseImage[3] = pygame.image.load("images/phaseThree.png")
-	phaseImage[4] = pygame.image.load("images/phaseFour.png")
-	phaseImage[5] = pygame.image.load("images/phaseFive.png")
-	phaseImage[6] = pygame.image.load("images/phaseSix.png")
-	phaseImage[7] = pygame.image.load("images/phaseSeven.png") # Crescent moon
+	phaseImage[0] = "phaseZero" # Full Moon
+	phaseImage[1] = "phaseOne" # Begin waning
+	phaseImage[2] = "phaseTwo"
+	phaseImage[3] = "phaseThree"
+	phaseImage[4] = "phaseFour"
+	phaseImage[5] = "phaseFive"
+	phaseImage[6] = "phaseSix"
+	phaseImage[7] = "phaseSeven" # Crescent moon
 
 	def __init__(self, x_location, y_location):
 		pygame.sprite.Sprite.__init__(self)
 
-		self.image = pygame.image.load("images/phaseZero.png")
+		self.image = image(Moon.phaseImage[0])
 
 		self.rect = self.image.get_rect()
 
@@ -603,103 +592,40 @@ class Moon(pygame.sprite.Sprite):
 			if self.phaseCooldown > 0:
 				self.phaseCooldown -= 1
 			elif self.currentPhase < 8:
-				self.image = Moon.phaseImage[self.currentPhase]
+				self.image = image(Moon.phaseImage[self.currentPhase])
 				self.currentPhase += 1
 				self.phaseCooldown = self.phaseDuration
 			elif self.currentPhase == 8:
 				finalBossEvent(data)
-				pygame.mixer.Sound.play(data.earthquakeSound)
-
-
-class jumperEnemy(PhysicalObject):
-	enemyImage = pygame.image.load("images/red.png")
-
-	def __init__(self, x_location, y_location):
-		pygame.sprite.Sprite.__init__(self)
-
-		self.image = jumperEnemy.enemyImage
-		self.rect = self.image.get_rect()
-
-		self.rect.x = x_location
-		self.rect.y = y_location
-
-		# Movement variables
-		self.dx = 0
-		self.dy = 0
-		self.horizontalTopSpeed = 15
-		self.verticalTopSpeed = 20
-		self.isGrounded = False
-		self.isWallSliding = False
-
-		# Attack Variables
-		self.damage = 1
-		self.knockback = 10
-
-	def update(self, data):
-		# Movement
-		self.rect.move_ip(self.dx, self.dy)
+				data.earthquakeSound.play()
 
-		# Physical Objects
-		self.gravitate(data)
-
-		# Intelligence
-		averagePlayerDistance = 0
-		players = 0
-		distance = 0
-		for player in data.players:
-			players += 1
-			distance += player.rect.centerx - self.rect.centerx
-		if players != 0:
-			distance = distance/players
-
-		self.playerDirection = sameSign(1, (distance - self.rect.centerx))
-
-		# Collisions
-		self.collisions(data)
-
-	def hitPlayer(self, player, data):
-		if player.isStunned == False:
-			pygame.mixer.Sound.play(data.hurtSound)
-			player.isStunned = True
-			player.stunCooldown = player.stunDuration
-			player.hp -= self.damage
-			player.dx = sameSign(self.knockback, self.dx)
-			player.dy = -self.knockback
-
-	def collisions(self, data):
-		for collision in pygame.sprite.spritecollide(self, data.terrain, False):
-			horizontalVelocity = self.playerDirection*random.randint(5, self.horizontalTopSpeed)
-			verticalVelocity = -random.randint(10, self.verticalTopSpeed)
-			self.dx = horizontalVelocity
-			self.dy = verticalVelocity
 
-		for collision in pygame.sprite.spritecollide(self, data.players, False):
-			self.hitPlayer(collision, data)
+# Knocks a player back and takes away some of their health, unless they
+# are still stunned from the last hit.
+def hurtPlayer(player, damage, knockback, dx, data):
+	if player.isStunned == False:
+		data.hurtSound.play()
+		player.isStunned = True
+		player.stunCooldown = player.stunDuration
+		player.hp -= damage
+		player.dx = sameSign(knockback, dx)
+		player.dy = -knockback
 
-		for collision in pygame.sprite.spritecollide(self, data.bullets, False):
-			collision.remove(data.bullets)
-			Explosion(self.rect.centerx, self.rect.centery).add(data.explosions)
-			data.score += 1000
-			self.remove(data.enemies)
 
-		if self.rect.left <= 0:
-			self.rect.left = 0
-			self.dx = -self.dx
-		elif self.rect.right >= data.width:
-			self.rect.right = data.width
-			self.dx = -self.dx
+# The jumper enemies are held together by a swarm.EnemySwarm in data.enemies.
+jumperEnemyImage = "red"
 
 
-class moonEnemy(jumperEnemy):
-	enemyImage = pygame.image.load("images/bigMoon.png")
+class moonEnemy(PhysicalObject):
+	enemyImage = "bigMoon"
 	explosionImage = [0,0,0,0]
-	explosionImage[0] = pygame.image.load("images/moonExp0.png")
-	explosionImage[1] = pygame.image.load("images/moonExp1.png")
-	explosionImage[2] = pygame.image.load("images/moonExp2.png")
+	explosionImage[0] = "moonExp0"
+	explosionImage[1] = "moonExp1"
+	explosionImage[2] = "moonExp2"
 
 	def __init__(self, x_location, y_location):
 		pygame.sprite.Sprite.__init__(self)
-		self.image = moonEnemy.enemyImage
+		self.image = image(moonEnemy.enemyImage)
 
 		self.rect = self.image.get_rect()
 
@@ -762,13 +688,14 @@ class moonEnemy(jumperEnemy):
 		if players != 0:
 			distance = distance/players
 
-		self.playerDirection = sameSign(1, (distance - self.rect.centerx))
+		screenCenterx = self.rect.centerx - data.cameraAdjustDistance
+		self.playerDirection = sameSign(1, (distance - screenCenterx))
 
 		# Cooldowns
 		self.rumbleCooldownFn(data)
 		self.soundCooldownFn(data)
 		if self.firstFrame == True:
-			pygame.mixer.Sound.play(data.moonBattleMusic)
+			data.moonBattleMusic.play()
 			self.firstFrame = False
 
 		# Collisions
@@ -778,7 +705,7 @@ class moonEnemy(jumperEnemy):
 		if self.hp < 13:
 			x = self.rect.centerx
 			y = self.rect.centery
-			self.image = moonEnemy.explosionImage[0]
+			self.image = image(moonEnemy.explosionImage[0])
 			self.rect = self.image.get_rect()
 			self.rect.centerx = x
 			self.rect.centery = y
@@ -786,34 +713,34 @@ class moonEnemy(jumperEnemy):
 		if self.hp < 8:
 			x = self.rect.centerx
 			y = self.rect.centery
-			self.image = moonEnemy.explosionImage[1]
+			self.image = image(moonEnemy.explosionImage[1])
 			self.rect = self.image.get_rect()
 			self.rect.centerx = x
 			self.rect.centery = y
-			xSign = random.choice([-1,1])
-			ySign = random.choice([-1,1])
+			xSign = data.rng.explosions.choice([-1,1])
+			ySign = data.rng.explosions.choice([-1,1])
 
-			randomX = xSign*random.randint(0,data.tileSize*5)
-			randomY = ySign*random.randint(0, data.tileSize*5)
+			randomX = xSign*data.rng.explosions.randint(0,data.tileSize*5)
+			randomY = ySign*data.rng.explosions.randint(0, data.tileSize*5)
 			if self.timer % 30 == 0:
-				data.explosions.add(Explosion(x+randomX,y+randomY))
+				explode(data, x+randomX, y+randomY)
 
 
 		if self.hp <= 0:
 			data.score *= 2
 			data.displayScore = True
-			data.explosions.add(moonExplosion(self.rect.centerx, self.rect.centery))
-			pygame.mixer.Sound.play(data.finalExplosionSound)
-			pygame.mixer.Sound.stop(data.moonBattleMusic)
+			bossExplosion(data, self.rect.centerx, self.rect.centery)
+			data.finalExplosionSound.play()
+			data.moonBattleMusic.stop()
 			self.remove(data.finalBoss)
 
 	def collisions(self, data):
-		for collision in pygame.sprite.spritecollide(self, data.terrain, False):
+		for tile in terrainCollisions(data, self.rect):
 			if self.soundCooldown == 0:
-				pygame.mixer.Sound.play(data.moonCrashSound)
+				data.moonCrashSound.play()
 				self.soundCooldown = 5
-			horizontalVelocity = self.playerDirection*random.randint(5, self.horizontalTopSpeed)
-			verticalVelocity = -random.randint(10, self.verticalTopSpeed)
+			horizontalVelocity = self.playerDirection*data.rng.boss.randint(5, self.horizontalTopSpeed)
+			verticalVelocity = -data.rng.boss.randint(10, self.verticalTopSpeed)
 			self.dx = horizontalVelocity
 			self.dy = verticalVelocity
 			self.rumbleCooldown = self.rumbleDuration
@@ -821,136 +748,114 @@ class moonEnemy(jumperEnemy):
 		for collision in pygame.sprite.spritecollide(self, data.players, False):
 			self.hitPlayer(collision, data)
 
-		for collision in pygame.sprite.spritecollide(self, data.bullets, False):
-			data.bullets.remove(collision)
-			self.hp -= 1
-
-		if self.rect.left <= 0:
-			self.rect.left = 0
+		if self.rect.left <= data.cameraAdjustDistance:
+			self.rect.left = data.cameraAdjustDistance
 			self.dx = -self.dx
-		elif self.rect.right >= data.width:
-			self.rect.right = data.width
+		elif self.rect.right >= data.cameraAdjustDistance + data.width:
+			self.rect.right = data.cameraAdjustDistance + data.width
 			self.dx = -self.dx
 
+	def hitPlayer(self, player, data):
+		hurtPlayer(player, self.damage, self.knockback, self.dx, data)
 
-class Explosion(pygame.sprite.Sprite):
-	explosionImage = [0,0,0,0] # 4 frames
-	explosionImage[0] = pygame.image.load("images/expZero.png")
-	explosionImage[1] = pygame.image.load("images/expOne.png")
-	explosionImage[2] = pygame.image.load("images/expTwo.png")
-	explosionImage[3] = pygame.image.load("images/expThree.png")
+	def hitByBullets(self, hits, data):
+		self.hp -= hits
 
-	def __init__(self, x, y, playSound=True):
-		pygame.sprite.Sprite.__init__(self)
-		self.image = Explosion.explosionImage[0]
 
-		self.rect = self.image.get_rect()
-		self.rect.centerx = x
-		self.rect.centery = y
+# Explosions are particles rather than sprites; see particles.py. A small
+# explosion's sound plays at most once every few ticks, however many go off.
+def explosionKinds(data):
+	return {"explosion": particles.ParticleKind(
+				[image("expZero"), image("expOne"), image("expTwo")], 5,
+				data.explosionSound, soundInterval=4),
+			"boss explosion": particles.ParticleKind([image("moonExp0")], 99)}
 
-		# Animation timings
-		self.frameDuration = 5
-		self.frameCooldown = self.frameDuration
-		self.currentAnimation = 0
 
-		# Sound
-		self.playSound = playSound
+# Sets off a small explosion at (x, y).
+def explode(data, x, y, playSound=True):
+	data.particles.emit("explosion", x, y, playSound)
 
-	def update(self, data):
-		# Sound
-		if self.playSound == True:
-			pygame.mixer.Sound.play(data.explosionSound)
-		self.playSound = False
-		# Animation
-		self.explosionAnimation(data)
-
-	def explosionAnimation(self,data):
-		if self.frameCooldown > 0:
-			self.frameCooldown -= 1
-		else:
-			self.currentAnimation += 1
-			self.image = Explosion.explosionImage[self.currentAnimation]
-			self.frameCooldown = self.frameDuration
-			if self.currentAnimation == len(Explosion.explosionImage)-1:
-				data.explosions.remove(self)
-
-
-class moonExplosion(pygame.sprite.Sprite):
-	frames = [0,0,0]
-	frames[0] = pygame.image.load("images/moonExp0.png")
-	frames[1] = pygame.image.load("images/moonExp1.png")
-	frames[2] = pygame.image.load("images/moonExp2.png")
 
-	def __init__(self,x,y):
-		pygame.sprite.Sprite.__init__(self)
-		self.image = moonExplosion.frames[0]
-		self.rect = self.image.get_rect()
-		self.rect.centerx = x
-		self.rect.centery = y
+# The final boss's death: a big explosion which lasts 100 ticks, with small
+# ones going off all over it after the first 10, and then the victory music.
+def bossExplosion(data, x, y):
+	data.particles.emit("boss explosion", x, y)
+	spread = image("moonExp0").get_width()/2
+	data.particles.addEmitter(particles.Emitter("explosion", x, y, spread, 3, 10, 100,
+		data.rng.explosions, finished=data.victoryMusic.play))
 
-		# Cooldowns and duration
-		self.frameDuration = 10
-		self.frameCooldown = self.frameDuration
-		self.currentAnimation = 0
-		self.updateTime = 100
 
-	def update(self, data):
-		# Animation
-		self.updateTime -= 1
-		self.explosionAnimation(data)
-		if self.updateTime == 0:
-			pygame.mixer.Sound.play(data.victoryMusic)
-			self.remove(data.explosions)
-
-	def explosionAnimation(self, data):
-		if self.frameCooldown > 0:
-			self.frameCooldown -= 1
-		else:
-			for smallExplosionNumber in xrange(3):
-				xSign = random.choice([-1, 1])
-				ySign = random.choice([-1, 1])
-				randomX = xSign*random.randint(0,abs(self.rect.left-self.rect.centerx))
-				randomY = ySign*random.randint(0,abs(self.rect.left-self.rect.centerx))
-				data.explosions.add(Explosion(self.rect.centerx + randomX,
-											 self.rect.centery + randomY, False))
+# The hearts of the health bars, blue for the first player and orange for
+# the second. They are drawn by the HUD.
+def heartImages():
+	return [image("blueHeart"), image("orangeHeart")]
 
 
-class Heart(pygame.sprite.Sprite):
-	blueHeart = pygame.image.load("images/blueHeart.png")
-	orangeHeart = pygame.image.load("images/orangeHeart.png")
+################################################
+# Game creation, updating, and control systems #
+################################################
 
-	def __init__(self, xPosition, yPosition, playerNumber):
-		pygame.sprite.Sprite.__init__(self)
-		if playerNumber == 0:
-			self.image = Heart.blueHeart
-		else:
-			self.image = Heart.orangeHeart
+# Gives the player one of their inputs: one of the player's controls,
+# "Hold Left", "Release Left", "Hold Right" or "Release Right" for the
+# keyboard's direction keys, or "Axis " and the direction the joystick is
+# held in. All of the player's input goes through here, so it can be
+# recorded against the tick it comes before.
+def applyAction(data, action):
+	if data.recorder != None:
+		data.recorder.record(data.tick, action)
+	if action.startswith("Axis "):
+		data.axisDirection = action[len("Axis "):]
+	elif action == "Hold Left" or action == "Release Left":
+		data.player.keyBoardLeft = (action == "Hold Left")
+	elif action == "Hold Right" or action == "Release Right":
+		data.player.keyBoardRight = (action == "Hold Right")
+	else:
+		data.player.control(action, data)
 
-		self.rect = self.image.get_rect()
-		self.rect.centerx = xPosition
-		self.rect.centery = yPosition
 
+# Saves the recording of the game which just ended, if it's being recorded.
+def finishRecording(data):
+	if data.recorder != None:
+		data.recorder.save(data.tick, replay.ending(data))
+		data.recorder = None
 
-################################################
-# Game creation, updating, and control systems #
-################################################
 
+# Each phase of a tick and of drawing is timed by the profiler, which shows
+# them in its overlay. The laps cost next to nothing while it's off.
 def updateGame(data):
+	data.tick += 1
+	# The joystick's direction is held until it changes, like a key.
+	if data.keyboardMode == False:
+		data.player.control(data.axisDirection, data)
 	if data.paused == False:
-		# Update sprites and remove sprites which are off the screen.
-		data.terrain.update(data)
-		data.underground.update(data)
+		profile = data.profiler
+		profile.start()
+		# Update sprites and remove columns which are off the screen.
+		expireOldCols(data)
+		profile.lap("expire columns")
 		data.players.update(data)
-		data.bullets.update(data)
-		data.enemies.update(data)
+		profile.lap("players")
+		data.bullets.update(data.map, data.tileSize, terrain.ground,
+							data.cameraAdjustDistance, data.width)
+		profile.lap("bullets")
+		updateSwarm(data)
+		profile.lap("enemies")
 		data.moon.update(data)
 		data.finalBoss.update(data)
-		data.explosions.update(data)
-		updateHealth(data)
+		profile.lap("moon and boss")
+		resolveBulletHits(data)
+		profile.lap("bullet hits")
+		data.particles.update()
+		profile.lap("explosions")
 
 		# Create new terrain as the player moves
-		if len(data.terrain.sprites()) < 400:
-			createNewCols(data, 1)
+		extendMap(data)
+		profile.lap("extend map")
+
+		# Keep the horde topped up in the stress mode.
+		if data.hordeSize > 0:
+			fillHorde(data)
+			profile.lap("horde")
 
 		# Checks if the final boss sequence has begun and what stage it's in.
 		if data.finalBossBegun == True and data.finalBossDelay > 0:
@@ -959,69 +864,164 @@ def updateGame(data):
 				rumbleGame(data)
 		elif data.finalBossBegun == True and data.finalBossDelay == 0:
 			data.finalBossBegun = False
-			data.finalBoss.add(moonEnemy(data.width/2, -200))
+			data.finalBoss.add(moonEnemy(data.cameraAdjustDistance + data.width/2, -200))
+
+
+# Steps the whole swarm of jumper enemies and hurts the players they touch.
+def updateSwarm(data):
+	players = data.players.sprites()
+	rects = []
+	for player in players:
+		rects.append(player.rect)
+	data.collisionGrid.insertRects("players", rects)
+	hits = data.enemies.step(data.map, data.tileSize, terrain.ground,
+							 data.collisionGrid, data.cameraAdjustDistance,
+							 data.width)
+	for enemy, playerIndex, dx in hits:
+		hurtPlayer(players[playerIndex], 1, 10, dx, data)
+
+
+# Finds which bullets hit the enemies and the final boss through the
+# collision grid. A bullet only counts against the first target it hits,
+# and each hit on a jumper enemy scores and explodes.
+def resolveBulletHits(data):
+	if len(data.bullets) == 0:
+		return
+	bosses = data.finalBoss.sprites()
+	rects = []
+	for boss in bosses:
+		rects.append(boss.rect)
+	grid = data.collisionGrid
+	grid.insert("bullets", *data.bullets.boxes())
+	grid.insert("enemies", *data.enemies.boxes())
+	grid.insertRects("finalBoss", rects)
+	spent = numpy.zeros(len(data.bullets), dtype=bool)
+
+	enemies, shots = spatial.firstClaims(*grid.pairs("enemies", "bullets"))
+	spent[shots] = True
+	hitCounts = spatial.countOf(enemies, len(data.enemies))
+	for enemy in numpy.flatnonzero(hitCounts):
+		x, y = data.enemies.center(enemy)
+		for hit in xrange(hitCounts[enemy]):
+			explode(data, x, y)
+			data.score += 1000
+	data.enemies.remove(hitCounts > 0)
 
+	targets, shots = grid.pairs("finalBoss", "bullets")
+	unspent = ~spent[shots]
+	targets, shots = spatial.firstClaims(targets[unspent], shots[unspent])
+	spent[shots] = True
+	hitCounts = spatial.countOf(targets, len(bosses))
+	for i in xrange(len(bosses)):
+		if hitCounts[i] > 0:
+			bosses[i].hitByBullets(int(hitCounts[i]), data)
+	data.bullets.remove(spent)
 
+
+# Shakes the screen by moving the camera back and forth when drawing.
 def rumbleGame(data):
 	if data.rumbleDirection == "Left":
 		data.rumbleDirection = "Right"
-		for sprite in data.terrain:
-			sprite.rect.move_ip(-data.rumblePower,0)
-		for sprite in data.underground:
-			sprite.rect.move_ip(-data.rumblePower,0)
-		for sprite in data.players:
-			sprite.rect.move_ip(-data.rumblePower,0)
-		data.cameraAdjustDistance += data.rumblePower
+		data.rumbleOffset = data.rumblePower
 	elif data.rumbleDirection == "Right":
 		data.rumbleDirection = "Left"
-		for sprite in data.terrain:
-			sprite.rect.move_ip(data.rumblePower,0)
-		for sprite in data.underground:
-			sprite.rect.move_ip(data.rumblePower,0)
-		for sprite in data.players:
-			sprite.rect.move_ip(data.rumblePower,0)
-		data.cameraAdjustDistance -= data.rumblePower
+		data.rumbleOffset = 0
 
 
 def spawnJumperEnemyOffScreen(data):
-	data.enemies.add(jumperEnemy((data.width+data.tileSize),data.tileSize))
+	xPosition = data.cameraAdjustDistance + data.width + data.tileSize
+	data.enemies.spawn(xPosition, data.tileSize)
+
 
+# Spawns enemies along the top of the screen until the horde is full again.
+def fillHorde(data):
+	enemyWidth = data.enemies.width
+	for i in xrange(data.hordeSize - len(data.enemies)):
+		xPosition = data.cameraAdjustDistance + data.rng.horde.randint(0, data.width - enemyWidth)
+		data.enemies.spawn(xPosition, data.tileSize)
 
-def updateHealth(data):
-	yPosition = data.tileSize
-	xPosition = data.tileSize
 
-	data.displayHealth = pygame.sprite.Group()
-	playerHealth = [[],[]]
+# The game is stepped in fixed ticks and drawn in between them. Before each
+# tick, everything which moves remembers where it was, and each frame is
+# drawn a fraction data.alpha of the way from there to where it is now.
+def rememberPositions(data):
+	data.previousCamera = data.cameraAdjustDistance
+	if data.inMenu == False:
+		for group in [data.players, data.finalBoss]:
+			for sprite in group:
+				sprite.previousPosition = sprite.rect.topleft
+		data.bullets.rememberPositions()
+		data.enemies.rememberPositions()
 
-	playerNumber = 0
-	for health in xrange(data.player.hp):
-		heart = Heart(xPosition, yPosition, playerNumber)
-		playerHealth[playerNumber].append(heart)
-		data.displayHealth.add(playerHealth[playerNumber][health])
-		xPosition += data.tileSize
+
+# Returns where the camera is drawn from this frame, including the rumble.
+def cameraView(data):
+	camera = timestep.interpolate(data.previousCamera, data.cameraAdjustDistance, data.alpha)
+	return camera + data.rumbleOffset
+
+
+# Draws a group of sprites which live in world coordinates. The camera
+# offset is only ever applied here. Sprites which appeared during the last
+# tick are drawn where they are.
+def drawWorldGroup(data, group):
+	camera = cameraView(data)
+	for sprite in group:
+		x, y = getattr(sprite, "previousPosition", sprite.rect.topleft)
+		x = timestep.interpolate(x, sprite.rect.x, data.alpha)
+		y = timestep.interpolate(y, sprite.rect.y, data.alpha)
+		data.surface.blit(sprite.image, (x - camera, y))
 
 
 def drawGame(data):
+	profile = data.profiler
+	profile.start()
 	data.moon.draw(data.surface)
-	data.bullets.draw(data.surface)
-	data.finalBoss.draw(data.surface)
-	data.enemies.draw(data.surface)
-	data.players.draw(data.surface)
-	data.underground.draw(data.surface)
-	data.terrain.draw(data.surface)
-	data.explosions.draw(data.surface)
-	data.displayHealth.draw(data.surface)
+	profile.lap("draw moon")
+	data.bullets.draw(data.surface, cameraView(data), data.alpha)
+	profile.lap("draw bullets")
+	drawWorldGroup(data, data.finalBoss)
+	profile.lap("draw boss")
+	data.enemies.draw(data.surface, cameraView(data), data.alpha)
+	profile.lap("draw enemies")
+	drawWorldGroup(data, data.players)
+	profile.lap("draw players")
+	data.chunks.draw(data.surface.static, cameraView(data))
+	profile.lap("draw terrain")
+	data.particles.draw(data.surface, cameraView(data))
+	profile.lap("draw explosions")
+	data.hud.drawHealth(data.surface, 0, data.player.hp,
+						(data.tileSize, data.tileSize))
 	if data.displayScore == True:
 		if data.score > data.highScore:
 			data.highScore = data.score
-		score = data.gameFont.render(("Score: %d") % data.score, 1, (255,255,255))
-		data.surface.blit(score, (2*data.width/5, data.height/3))
-		score = data.gameFont.render(("HighScore: %d") % data.score, 1, (255,255,255))
-		data.surface.blit(score, (2*data.width/5-data.tileSize*2, data.height/3+data.tileSize))
+		data.hud.drawScore(data.surface, data.score, (2*data.width/5, data.height/3))
 	if data.paused == True:
-		pause = data.gameFont.render("PAUSED", 1, (255,255,255))
-		data.surface.blit(pause, (2*data.width/5, data.tileSize))
+		data.hud.drawPause(data.surface, (2*data.width/5, data.tileSize))
+	profile.lap("draw hud")
+	if profile.enabled == True:
+		drawProfiler(data)
+		profile.lap("draw profiler")
+
+
+# Draws the profiler's overlay in the top right corner, with the number of
+# each kind of thing in the game. The overlay is only made once it's shown.
+def drawProfiler(data):
+	if data.profilerOverlay == None:
+		font = assetRegistry.font("fonts/PressStart2P.ttf", 8)
+		data.profilerOverlay = profiler.ProfilerOverlay(data.profiler, font)
+	counts = [("players", len(data.players)),
+			  ("enemies", len(data.enemies)),
+			  ("bullets", len(data.bullets)),
+			  ("explosions", len(data.particles)),
+			  ("bullets peak", data.bullets.highWater),
+			  ("enemies peak", data.enemies.highWater),
+			  ("explosions peak", data.particles.highWater),
+			  ("pool misses", data.bullets.misses + data.enemies.misses),
+			  ("explosions lost", data.particles.dropped),
+			  ("boss", len(data.finalBoss)),
+			  ("map columns", data.map.endCol - data.map.firstCol),
+			  ("terrain chunks", len(data.chunks.chunks))]
+	data.profilerOverlay.draw(data.surface, counts, (data.width - 4, 4))
 
 
 def initMenu(data):
@@ -1037,12 +1037,25 @@ def initMenu(data):
 	# Create the surface
 	data.height = 632
 	data.width = 964
-	data.surface = pygame.display.set_mode((data.width, data.height))
+	if data.headless == True:
+		# Nothing is shown, so the game is drawn off the screen, if at all.
+		data.surface = screen.Screen(pygame.Surface((data.width, data.height)))
+	else:
+		data.surface = screen.Screen(pygame.display.set_mode((data.width, data.height)),
+									 data.dirtyRects)
+		assetRegistry.setDisplayReady()
+		if data.preloadAssets == True:
+			preloadAssets(data)
+		pygame.display.set_caption("New Moon")
+	# What's drawn is made before the preload has packed the atlas, so it's
+	# made again from the atlas when the splash screen ends.
+	data.atlasPending = (data.headless == False and data.preloadAssets == True and
+						 assetRegistry.atlas == None)
 	surfaceColor = (0,0,0)
 	data.surface.fill(surfaceColor)
-	pygame.display.set_caption("New Moon")
-	data.gameFont = pygame.font.Font("fonts/PressStart2P.ttf", 24)
-	data.gameSmallFont = pygame.font.Font("fonts/PressStart2P.ttf", 14)
+	data.gameFont = assetRegistry.font("fonts/PressStart2P.ttf", 24)
+	data.gameSmallFont = assetRegistry.font("fonts/PressStart2P.ttf", 14)
+	data.textCache = hud.TextCache()
 
 	# Set up the game clock
 	data.fpsClock = pygame.time.Clock()
@@ -1053,35 +1066,30 @@ def initMenu(data):
 	# Create the camera and rumble effect
 	data.cameraScrollPoint = 2*data.width/3
 	data.cameraAdjustDistance = 0
+	data.previousCamera = 0
 	data.cameraLock = False
 	data.rumbleDirection = "Left"
+	data.rumbleOffset = 0 # Added to the camera when drawing.
 	data.rumblePower = 20
 
 	# Create the moving terrain
 	data.rows = 20
 	data.cols = 30
-	data.tileSize = Ground.tileImage.get_rect().width
-	underground = 2
-	surface = 1
-	air = 0
+	data.tileSize = image("green").get_rect().width
 	data.highestRow = 10 # The highest row. Past this point the map can no longer go up.
 	data.lowestRow = data.rows - 2 # Past this point the map can no longer go down.
-	data.terrain = pygame.sprite.Group()
-	data.underground = pygame.sprite.Group()
+	data.mapMargin = data.cols # Columns generated ahead of the screen.
+	data.mapCapacity = data.width/data.tileSize + data.mapMargin + 6
+	data.chunkCols = 2*data.cols # Each terrain chunk is about two screens wide.
 	data.colsGenerated = 0
 	data.contour = "Plains"
 	data.contours = ["Plains", "Hills", "Mountains"]
 	data.contourIndex = 0
-	generateRandomMap(data)
 
-	# Create the list of enemies
-	data.enemies = pygame.sprite.Group()
+	# Create the grid which finds the collisions between moving objects
+	data.collisionGrid = spatial.SpatialHash(2*data.tileSize)
 
-	# Create the empty list of bullets
-	data.bullets = pygame.sprite.Group()
-
-	# Create the empty list of explosions
-	data.explosions = pygame.sprite.Group()
+	initDrawables(data)
 
 	# Create the empty list for the final boss
 	data.finalBoss = pygame.sprite.Group()
@@ -1092,29 +1100,51 @@ def initMenu(data):
 	data.moon = pygame.sprite.Group(Moon(data.width-200, 200))
 
 
+# Makes the map, the HUD, the enemies, the bullets and the explosions, which
+# hold on to the images they draw.
+def initDrawables(data):
+	generateRandomMap(data)
+
+	# Create the HUD, which draws the hearts, score and pause message
+	data.hud = hud.Hud(data.gameFont, heartImages(), data.tileSize)
+
+	# Create the swarm of enemies
+	data.enemies = swarm.EnemySwarm(image(jumperEnemyImage), PhysicalObject.gravity,
+									PhysicalObject.terminalVelocity,
+									random.randrange(2**31),
+									data.poolSizes["enemies"] + data.hordeSize)
+
+	# Create the empty list of bullets
+	data.bullets = bullets.BulletSystem(bulletImages(), data.poolSizes["bullets"])
+
+	# Create the empty set of explosions, which never holds more than its
+	# capacity.
+	data.particles = particles.ParticleSystem(explosionKinds(data),
+											  data.poolSizes["explosions"])
+
+
 def drawMenu(data):
 	if data.splashCoolDown == 0:		
 		data.moon.draw(data.surface)
-		data.underground.draw(data.surface)
-		data.terrain.draw(data.surface)
-		start = data.gameFont.render("Start game", 1, (data.startColor))
+		data.chunks.draw(data.surface.static, cameraView(data))
+		start = data.textCache.render(data.gameFont, "Start game", (data.startColor))
 		data.surface.blit(start, (data.width/8, data.height/4))
-		terrainChoice = data.gameFont.render(data.contour, 1,
-											 data.terrainChoiceColor)
+		terrainChoice = data.textCache.render(data.gameFont, data.contour,
+											  data.terrainChoiceColor)
 		data.surface.blit(terrainChoice, (data.width/8, data.height/4+data.tileSize))
 		if data.helpMenu == 0:
-			help = data.gameSmallFont.render("for controls", 1, data.white)
+			help = data.textCache.render(data.gameSmallFont, "for controls", data.white)
 			data.surface.blit(help, (data.width-data.tileSize*8, data.tileSize*2))
-			h = data.gameSmallFont.render("'y'", 1, data.yellow)
+			h = data.textCache.render(data.gameSmallFont, "'y'", data.yellow)
 			data.surface.blit(h, (data.width-data.tileSize*6, data.tileSize))
 		elif data.helpMenu == 1:
-			controls1 = data.gameSmallFont.render("Joystick to move", 1, data.white)
-			controls2 = data.gameSmallFont.render("Middle X to restart", 1, data.white)
-			controls3 = data.gameSmallFont.render("Blue x to shoot", 1, data.white)
-			controls4 = data.gameSmallFont.render("Green A to jump", 1, data.white)
-			controls5 = data.gameSmallFont.render("L or R to dash", 1, data.white)
-			controls6 = data.gameSmallFont.render("Start to pause", 1, data.white)
-			controls7 = data.gameSmallFont.render("L and R switch terrain", 1, data.white)
+			controls1 = data.textCache.render(data.gameSmallFont, "Joystick to move", data.white)
+			controls2 = data.textCache.render(data.gameSmallFont, "Middle X to restart", data.white)
+			controls3 = data.textCache.render(data.gameSmallFont, "Blue x to shoot", data.white)
+			controls4 = data.textCache.render(data.gameSmallFont, "Green A to jump", data.white)
+			controls5 = data.textCache.render(data.gameSmallFont, "L or R to dash", data.white)
+			controls6 = data.textCache.render(data.gameSmallFont, "Start to pause", data.white)
+			controls7 = data.textCache.render(data.gameSmallFont, "L and R switch terrain", data.white)
 			data.surface.blit(controls1, (data.width-data.tileSize*10, data.tileSize))
 			data.surface.blit(controls2, (data.width-data.tileSize*10, data.tileSize*1.5))
 			data.surface.blit(controls3, (data.width-data.tileSize*10, data.tileSize*2))
@@ -1123,9 +1153,9 @@ def drawMenu(data):
 			data.surface.blit(controls6, (data.width-data.tileSize*10, data.tileSize*3.5))
 			data.surface.blit(controls7, (data.width-data.tileSize*10, data.tileSize*4))
 	else:
-		splash = data.gameFont.render(("-New Moon-"), 1, (255, 0, 0))
+		splash = data.textCache.render(data.gameFont, ("-New Moon-"), (255, 0, 0))
 		data.surface.blit(splash, (2*data.width/5-data.tileSize, data.height/2))
-		credit = data.gameFont.render(("15-112"), 1, (255, 0, 0))
+		credit = data.textCache.render(data.gameFont, ("15-112"), (255, 0, 0))
 		data.surface.blit(credit, (2*data.width/5+data.tileSize*.5,
 								 data.height/2+data.tileSize))
 
@@ -1133,58 +1163,87 @@ def drawMenu(data):
 def updateMenu(data):
 	if data.splashCoolDown > 0:
 		data.splashCoolDown -= 1
+		if data.splashCoolDown == 0:
+			if data.atlasPending == True:
+				assetRegistry.waitForPreload()
+				initDrawables(data)
+				data.atlasPending = False
+			data.surface.invalidate() # The terrain appears behind the menu.
 	else:
-		data.terrain.update(data)
-		data.underground.update(data)
-		adjustment = -3
-		for sprite in data.terrain:
-			sprite.rect.move_ip(adjustment, 0)
-		for sprite in data.underground:
-			sprite.rect.move_ip(adjustment, 0)
-		data.cameraAdjustDistance += abs(adjustment)
+		expireOldCols(data)
+		data.cameraAdjustDistance += 3
 
 		# Create new terrain as the player moves
-		if len(data.terrain.sprites()) < 400:
-			createNewCols(data, 1)
+		extendMap(data)
 
 
+# The sounds are only loaded the first time they are played, unless the
+# preload gets to them first.
 def initSounds(data):
-	data.deathSound = pygame.mixer.Sound("sounds/death.wav")
-	data.deathSound.set_volume(.4)
-	data.moonCrashSound = pygame.mixer.Sound("sounds/moonCrash.wav")
-	data.explosionSound = pygame.mixer.Sound("sounds/explosion.wav")
-	data.explosionSound.set_volume(.5)
-	data.earthquakeSound = pygame.mixer.Sound("sounds/earthquake.wav")
-	data.finalExplosionSound = pygame.mixer.Sound("sounds/finalExplosion.wav")
-	data.jumpSound = pygame.mixer.Sound("sounds/jump.wav")
-	data.jumpSound2 = pygame.mixer.Sound("sounds/jump2.wav")
-	data.pauseSound = pygame.mixer.Sound("sounds/pause.wav")
-	data.hurtSound = pygame.mixer.Sound("sounds/hurt.wav")
-	data.moonBattleMusic = pygame.mixer.Sound("music/moonBattle.wav")
-	data.moonBattleMusic.set_volume(.3)
-	data.mountainMusic = pygame.mixer.Sound("music/armoredArmadillo.wav")
-	data.mountainMusic.set_volume(.4)
-	data.hillsMusic = pygame.mixer.Sound("music/launchOctopus.wav")
-	data.hillsMusic.set_volume(.4)
-	data.plainsMusic = pygame.mixer.Sound("music/stingChameleon.wav")
-	data.plainsMusic.set_volume(.4)
-	data.victoryMusic = pygame.mixer.Sound("music/victory.wav")
-	data.victoryMusic.set_volume(.4)
+	data.sounds = []
+	data.deathSound = lazySound(data, "sounds/death.wav", .4)
+	data.moonCrashSound = lazySound(data, "sounds/moonCrash.wav")
+	data.explosionSound = lazySound(data, "sounds/explosion.wav", .5)
+	data.earthquakeSound = lazySound(data, "sounds/earthquake.wav")
+	data.finalExplosionSound = lazySound(data, "sounds/finalExplosion.wav")
+	data.jumpSound = lazySound(data, "sounds/jump.wav")
+	data.jumpSound2 = lazySound(data, "sounds/jump2.wav")
+	data.pauseSound = lazySound(data, "sounds/pause.wav")
+	data.hurtSound = lazySound(data, "sounds/hurt.wav")
+	data.moonBattleMusic = musicTrack(data, "music/moonBattle.wav", .3)
+	data.mountainMusic = musicTrack(data, "music/armoredArmadillo.wav", .4)
+	data.hillsMusic = musicTrack(data, "music/launchOctopus.wav", .4)
+	data.plainsMusic = musicTrack(data, "music/stingChameleon.wav", .4)
+	data.victoryMusic = musicTrack(data, "music/victory.wav", .4)
+
+
+# Without audio, as when the game runs headless, every sound is silent.
+def lazySound(data, path, volume=None):
+	if data.headless == True:
+		return assets.SilentSound(path, volume)
+	sound = assets.LazySound(assetRegistry, path, volume)
+	data.sounds.append(sound)
+	return sound
+
+# The music is streamed from its files as it plays, not loaded.
+def musicTrack(data, path, volume=None):
+	if data.headless == True:
+		return assets.SilentSound(path, volume)
+	return assets.MusicTrack(path, volume)
 
 
 def initGame(data):
 	# Menu Conversion
 	data.inMenu = False
-	data.enemies.remove(data.enemies)
+	data.enemies.clear()
+	data.surface.invalidate()
 	data.cameraAdjustDistance = 0
+	data.previousCamera = 0
+
+	# Every part of the game draws from its own random stream, all seeded
+	# from the game's seed, and the inputs are recorded against the ticks,
+	# so the game can be played again exactly.
+	if data.seed != None:
+		seed = data.seed
+	else:
+		seed = random.randrange(2**31)
+	data.rng = replay.RandomStreams(seed)
+	data.enemies.reseed(data.rng.enemies.randrange(2**31))
+	data.tick = 0
+	data.axisDirection = "No Direction"
+	if data.recordPath != None:
+		data.waitForTerrain = True # So the map grows the same way in the replay.
+		data.recorder = replay.InputRecorder(data.recordPath,
+			{"seed": seed, "contour": data.contour, "keyboardMode": data.keyboardMode,
+			 "hordeSize": data.hordeSize})
 
 	# Sound
 	if data.contour == "Mountains":
-		pygame.mixer.Sound.play(data.mountainMusic)
+		data.mountainMusic.play()
 	elif data.contour == "Hills":
-		pygame.mixer.Sound.play(data.hillsMusic)
+		data.hillsMusic.play()
 	else:
-		pygame.mixer.Sound.play(data.plainsMusic)
+		data.plainsMusic.play()
 
 	# Create the player instance
 	data.player = Player(50, 50)
@@ -1193,15 +1252,13 @@ def initGame(data):
 	# Create the terrain
 	data.rows = 20
 	data.cols = 30
-	data.tileSize = Ground.tileImage.get_rect().width
-	underground = 2
-	surface = 1
-	air = 0
+	data.tileSize = image("green").get_rect().width
 	data.highestRow = 10 # The highest row. Past this point the map can no longer go up.
 	data.lowestRow = data.rows - 2 # Past this point the map can no longer go down.
-	data.terrain = pygame.sprite.Group()
-	data.underground = pygame.sprite.Group()
-	generateRandomMap(data)
+	data.mapMargin = data.cols # Columns generated ahead of the screen.
+	data.mapCapacity = data.width/data.tileSize + data.mapMargin + 6
+	data.chunkCols = 2*data.cols # Each terrain chunk is about two screens wide.
+	generateRandomMap(data, data.rng.terrain.randrange(2**31))
 	data.colsGenerated = 0
 
 	# Create the moon
@@ -1210,14 +1267,13 @@ def initGame(data):
 	# Defining the display and score variables
 	data.displayScore = False
 	data.score = 0
-	data.displayHealth = pygame.sprite.Group()
 
 
 def finalBossEvent(data):
 	pygame.sprite.Group.empty(data.moon)
 	data.finalBossBegun = True
 	data.cameraLock = True
-	pygame.mixer.stop()
+	assets.stopAll()
 
 
 def joystickInit(data):
@@ -1249,6 +1305,79 @@ def joystickInit(data):
 # Main Loop #
 #############
 
+# Running "python project.py --horde 2000" keeps that many jumper enemies on
+# the screen at once, as a stress test. Returns 0 when it isn't asked for.
+def hordeSizeArgument(arguments):
+	if "--horde" in arguments:
+		index = arguments.index("--horde")
+		if index + 1 < len(arguments):
+			return int(arguments[index + 1])
+		return 2000
+	return 0
+
+
+# Running with "--pool-bullets N", "--pool-enemies N" or "--pool-explosions N"
+# makes room for N of them up front, or for explosions, sets how many there
+# can ever be. The profiler's overlay shows the most there have been at once.
+def poolSizesArgument(arguments):
+	poolSizes = {"bullets": 64, "enemies": 64, "explosions": 256}
+	for name in poolSizes:
+		if "--pool-" + name in arguments:
+			poolSizes[name] = int(arguments[arguments.index("--pool-" + name) + 1])
+	return poolSizes
+
+
+def fpsArgument(arguments):
+	if "--fps" in arguments:
+		return int(arguments[arguments.index("--fps") + 1])
+	return 120
+
+
+# Returns the "data" variable which the whole game's state is stored in,
+# set up from the command line arguments. A headless game has no window or
+# audio; see simulate.py.
+def newData(arguments, headless=False):
+	class Struct():
+		pass
+
+	data = Struct()
+	data.headless = headless
+	data.highScore = 0
+	data.hordeSize = hordeSizeArgument(arguments)
+	# Running with "--dirty-rects" only redraws the parts of the screen which
+	# changed while the camera stays still.
+	data.dirtyRects = "--dirty-rects" in arguments
+	# Running with "--no-preload" loads each asset when it's first used,
+	# instead of loading them all while the splash screen shows.
+	data.preloadAssets = "--no-preload" not in arguments
+	# The game is stepped 60 times a second however fast it's drawn. Running
+	# with "--fps N" draws at most N frames a second, or as many as it can
+	# with "--fps 0".
+	data.timestep = timestep.FixedTimestep(60)
+	data.alpha = 1 # How far between the last two ticks to draw.
+	data.maxFps = fpsArgument(arguments)
+	data.waitForTerrain = False
+	# F3 shows the profiler's overlay, or running with "--profile" shows it
+	# from the start.
+	data.profiler = profiler.FrameProfiler()
+	data.profiler.enabled = "--profile" in arguments
+	data.profilerOverlay = None
+	# Running with "--seed N" starts every game from the same seed, and
+	# "--record run.rec" records each game to run.rec; see replay.py.
+	data.seed = None
+	if "--seed" in arguments:
+		data.seed = int(arguments[arguments.index("--seed") + 1])
+	data.recordPath = None
+	if "--record" in arguments:
+		data.recordPath = arguments[arguments.index("--record") + 1]
+	data.recorder = None
+	data.tick = 0
+	# How many of each thing there's room for before any more has to be
+	# made, or for explosions, the most there can ever be.
+	data.poolSizes = poolSizesArgument(arguments)
+	return data
+
+
 def main():
 	# Menu
 	# Begin the game
@@ -1256,11 +1385,11 @@ def main():
 	pygame.mixer.init()
 
 	# Allowing data storage in a "data" variable
-	class Struct():
-		pass
+	data = newData(sys.argv[1:])
 
-	data = Struct()
-	data.highScore = 0
+	# Assets come from the bundle built by "python bundle.py", if there is one.
+	if os.path.exists(bundle.bundlePath):
+		assetRegistry.useBundle(bundle.Bundle())
 
 	joystickInit(data)
 
@@ -1271,10 +1400,12 @@ def main():
 	while True:
 		if startGame == True:
 			initMenu(data)
+			data.timestep.reset()
 		startGame = False
 
 		for event in pygame.event.get():
 			if event.type == QUIT:
+				stopTerrainProducer(data)
 				pygame.quit()
 				sys.exit()
 			if data.keyboardMode == False:
@@ -1310,16 +1441,21 @@ def main():
 							data.contourIndex = 2
 						data.contour = data.contours[data.contourIndex]
 
-		data.surface.fill((0,0,0))
-		updateMenu(data)
+		# Step the menu at the fixed tick rate, then draw it.
+		for tick in xrange(data.timestep.advance()):
+			rememberPositions(data)
+			updateMenu(data)
+		data.alpha = data.timestep.alpha()
+		data.surface.beginFrame(cameraView(data))
 		drawMenu(data)
-		pygame.display.update()
-		data.fpsClock.tick(60)
+		data.surface.present()
+		data.fpsClock.tick(data.maxFps)
 
 		if startGame == True:
 			startGame = False
 			# Initiate the game
 			initGame(data)
+			data.timestep.reset()
 
 			# Main loop
 			while True:
@@ -1328,62 +1464,67 @@ def main():
 				for event in pygame.event.get():
 					# Quitting
 					if event.type == QUIT:
+						finishRecording(data)
+						stopTerrainProducer(data)
 						pygame.quit()
 						sys.exit()
 
+					elif event.type == KEYDOWN and event.key == K_F3:
+						data.profiler.toggle()
+
 					elif data.keyboardMode == False:
 						# Joystick controls
 						if event.type == JOYBUTTONDOWN:
 
 							# Movement Modifiers
 							if event.button == 8 or event.button == 9:
-								data.player.control("Dash", data)
+								applyAction(data, "Dash")
 
 							elif event.button == 11:
-								data.player.control("Jump", data)
+								applyAction(data, "Jump")
 
 							elif event.button == 13:
-								data.player.control("Shoot", data)
+								applyAction(data, "Shoot")
 
 							elif event.button == 10:
 								startGame = True
 
 							elif event.button == 4:
-								data.player.control("Pause", data)
+								applyAction(data, "Pause")
 
 						elif event.type == JOYBUTTONUP:
 
 							# Movement Modifiers
 							if event.button == 11:
-								data.player.control("Jump Released", data)
+								applyAction(data, "Jump Released")
 
 					elif data.keyboardMode == True:
 						if event.type == KEYDOWN:
 
 							# Controls
 							if event.key == K_a:
-								data.player.keyBoardLeft = True
+								applyAction(data, "Hold Left")
 
 							elif event.key == K_d:
-								data.player.keyBoardRight = True
+								applyAction(data, "Hold Right")
 
 							elif event.key == K_s:
-								data.player.control("Down", data)
+								applyAction(data, "Down")
 
 							elif event.key == K_SPACE:
-								data.player.control("Jump", data)
+								applyAction(data, "Jump")
 
 							elif event.key == K_w:
-								data.player.control("Jump", data)
+								applyAction(data, "Jump")
 
 							elif event.key == K_m:
-								data.player.control("Shoot", data)
+								applyAction(data, "Shoot")
 
 							elif event.key == K_n:
-								data.player.control("Dash", data)
+								applyAction(data, "Dash")
 
 							elif event.key == K_p:
-								data.player.control("Pause", data)
+								applyAction(data, "Pause")
 
 							elif event.key == K_r:
 								startGame = True
@@ -1391,40 +1532,52 @@ def main():
 						elif event.type == KEYUP:
 
 							if event.key == K_SPACE:
-								data.player.control("Jump Released", data)
+								applyAction(data, "Jump Released")
 
 							if event.key == K_w:
-								data.player.control("Jump Released", data)
+								applyAction(data, "Jump Released")
 
 							elif event.key == K_d:
-								data.player.keyBoardRight = False
+								applyAction(data, "Release Right")
 
 							elif event.key == K_a:
-								data.player.keyBoardLeft = False
+								applyAction(data, "Release Left")
+
 
 
+				# Update the game at the fixed tick rate, as many times as
+				# the time since the last frame calls for.
+				for tick in xrange(data.timestep.advance()):
 
-				# Joystick Axis Controls
+					# Joystick Axis Controls
 
-				if data.keyboardMode == False:
-					x_axis = data.joystick1.get_axis(0)
-					y_axis = data.joystick1.get_axis(1)
-					if y_axis > .7: data.player.control("Down", data)
-					elif x_axis < -.3: data.player.control("Left", data)
-					elif x_axis > .3: data.player.control("Right", data)
-					else: data.player.control("No Direction", data)
+					if data.keyboardMode == False:
+						x_axis = data.joystick1.get_axis(0)
+						y_axis = data.joystick1.get_axis(1)
+						if y_axis > .7: direction = "Down"
+						elif x_axis < -.3: direction = "Left"
+						elif x_axis > .3: direction = "Right"
+						else: direction = "No Direction"
+						if direction != data.axisDirection:
+							applyAction(data, "Axis " + direction)
 
+					rememberPositions(data)
+					updateGame(data)
 
-				# Draw and update the game
-				data.surface.fill((0,0,0))
-				updateGame(data)
+				# Draw the game between the last two ticks
+				data.alpha = data.timestep.alpha()
+				data.surface.beginFrame(cameraView(data))
 				drawGame(data)
-				pygame.display.update()
+				data.surface.present()
+				data.profiler.lap("present")
 
 				if startGame == True:
-					pygame.mixer.stop()
+					finishRecording(data)
+					assets.stopAll()
 					break
 
-				data.fpsClock.tick(60)
+				data.fpsClock.tick(data.maxFps)
+				data.profiler.endFrame()
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+	main()
\ No newline at end of file
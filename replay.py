@@ -0,0 +1,129 @@
+import json
+import os
+import random
+import sys
+import pygame
+import screen
+
+##########
+# Replay #
+##########
+
+# Every game gets its own seed, which seeds a random stream for each part
+# of the game, and every input the player gives is recorded against the
+# tick it came before. Playing the same inputs on the same ticks from the
+# same seed plays the game out exactly the same. Run
+#   python project.py --record run.rec
+# to record each game to run.rec, which holds the last one played, and
+#   python replay.py run.rec
+# to play it again without drawing, and check it ended the same way. With
+# "--draw" it's drawn off the screen too, and with "--window" it's shown at
+# the normal speed.
+#
+# A recording starts with a header line, "# " and then its settings as
+# JSON, and then has one input a line, "<tick> <action>", so it's also a
+# script that simulate.py can run.
+
+replayVersion = 1
+
+# The random streams, one for each part of the game, so what happens in
+# one part doesn't change the numbers another part gets.
+class RandomStreams(object):
+	names = ["terrain", "enemies", "boss", "explosions", "horde"]
+
+	def __init__(self, seed):
+		self.seed = seed
+		seeds = random.Random(seed)
+		for name in RandomStreams.names:
+			setattr(self, name, random.Random(seeds.randrange(2**31)))
+
+
+# Keeps the inputs of a game as it's played, and saves them with the
+# settings needed to play it again.
+class InputRecorder(object):
+	def __init__(self, path, settings):
+		self.path = path
+		self.settings = settings
+		self.actions = [] # (tick, action) in the order they were given.
+
+	def record(self, tick, action):
+		self.actions.append((tick, action))
+
+	# Saves the recording, along with the number of ticks played and how
+	# the game ended, to check a replay against.
+	def save(self, ticks, ending):
+		header = dict(self.settings)
+		header["version"] = replayVersion
+		header["ticks"] = ticks
+		header["ending"] = ending
+		with open(self.path, "w") as recordingFile:
+			recordingFile.write("# " + json.dumps(header, sort_keys=True) + "\n")
+			for tick, action in self.actions:
+				recordingFile.write("%d %s\n" % (tick, action))
+
+
+# Returns a recording's header.
+def loadHeader(path):
+	with open(path) as recordingFile:
+		line = recordingFile.readline()
+	if not line.startswith("# "):
+		raise ValueError("%s is not a recording" % path)
+	header = json.loads(line[2:])
+	if header["version"] != replayVersion:
+		raise ValueError("%s was recorded by another version" % path)
+	return header
+
+
+# Returns where things ended up in a game, to compare a replay against.
+def ending(data):
+	return [data.tick, data.score, data.cameraAdjustDistance, data.player.hp,
+			data.map.endCol, len(data.enemies), len(data.bullets), len(data.finalBoss)]
+
+
+# Plays a recording again. Returns True if it ended the same way.
+def replay(path, draw=False, window=False):
+	import project # Imported here, since the game imports this module.
+	import simulate
+	header = loadHeader(path)
+	data = simulate.newMenu(header["hordeSize"])
+	data.keyboardMode = header["keyboardMode"]
+	data.seed = header["seed"]
+	data.waitForTerrain = True
+	data.contour = header["contour"]
+	if window == True:
+		data.surface = screen.Screen(pygame.display.set_mode((data.width, data.height)))
+	project.initGame(data)
+	script = simulate.ScriptedInput.load(path)
+
+	for tick in xrange(header["ticks"]):
+		script.apply(tick, data)
+		project.updateGame(data)
+		if draw == True or window == True:
+			data.surface.beginFrame(project.cameraView(data))
+			project.drawGame(data)
+		if window == True:
+			pygame.event.pump()
+			data.surface.present()
+			data.fpsClock.tick(60)
+	script.apply(header["ticks"], data) # The inputs after the last tick.
+	project.stopTerrainProducer(data)
+	return ending(data) == header["ending"]
+
+
+def main():
+	arguments = sys.argv[1:]
+	if len(arguments) == 0:
+		print("Usage: python replay.py recording [--draw] [--window]")
+		sys.exit(2)
+	window = "--window" in arguments
+	if window == False:
+		os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+	if replay(arguments[0], "--draw" in arguments, window):
+		print("The replay ended the same way as the recording")
+	else:
+		print("The replay ended differently from the recording")
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
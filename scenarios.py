@@ -0,0 +1,227 @@
+import json
+import os
+import random
+import sys
+import time
+import numpy
+import pygame
+import project
+import simulate
+
+#######################
+# Benchmark Scenarios #
+#######################
+
+# Plays fixed scenarios headlessly and times each frame's update and draw.
+# Every scenario has its own seed and scripted input, and waits for the
+# terrain instead of racing its thread, so it plays out the same on every
+# run. Run
+#   python scenarios.py --out results.json
+# to time every scenario and save the results, and
+#   python scenarios.py --compare results.json
+# to run them again and flag any which got slower than the saved results.
+# "--only scroll-hills,menu" runs just the named scenarios, and
+# "--tolerance 0.3" allows 30% slower before flagging a regression, and
+# "--pool-bullets 256" and the like set the pool sizes, as in the game.
+
+warmupFrames = 30 # Left out of the results, while the caches fill.
+tolerance = 0.15 # How much slower than the baseline counts as a regression.
+noiseFloor = 0.05 # Milliseconds slower which never count, however small the time.
+
+
+class Scenario(object):
+	# start(data) sets the scenario up, and everyFrame(data, frame) runs
+	# before each frame's input. A menu scenario steps the menu instead of
+	# a game.
+	def __init__(self, name, frames, seed, contour="Plains", menu=False,
+				 script=None, start=None, everyFrame=None):
+		self.name = name
+		self.frames = frames
+		self.seed = seed
+		self.contour = contour
+		self.menu = menu
+		self.script = script
+		self.start = start
+		self.everyFrame = everyFrame
+
+
+# Returns a script which repeats the given actions on these frames of every
+# period frames.
+def repeatingScript(frames, period, actions):
+	script = []
+	for start in xrange(0, frames, period):
+		for offset, action in actions:
+			script.append((start + offset, action))
+	return simulate.ScriptedInput(script)
+
+
+def keepAlive(data, frame):
+	data.player.hp = 10
+
+# Keeps the player alive and holds the moon at its first phase, so the
+# final boss never locks the camera.
+def keepScrolling(data, frame):
+	keepAlive(data, frame)
+	for moon in data.moon:
+		moon.phaseCooldown = moon.phaseDuration
+
+# Spawns jumper enemies just off the screen until there are 1500 of them.
+def flood(data, frame):
+	keepScrolling(data, frame)
+	if len(data.enemies) < 1500:
+		for i in xrange(4):
+			project.spawnJumperEnemyOffScreen(data)
+
+
+def runRight(frames):
+	return repeatingScript(frames, 20, [(0, "Hold Right"), (0, "Jump")])
+
+def runAndFire(frames):
+	return repeatingScript(frames, 20, [(0, "Hold Right"), (0, "Jump")] +
+						   [(i, "Shoot") for i in xrange(20)])
+
+# Keeps the player alive and running after the boss, so their shots face it.
+def chaseBoss(data, frame):
+	keepAlive(data, frame)
+	for boss in data.finalBoss:
+		data.player.keyBoardRight = boss.rect.centerx > data.player.rect.centerx
+		data.player.keyBoardLeft = not data.player.keyBoardRight
+
+# Jumps and fires at the boss.
+def fightBoss(frames):
+	return repeatingScript(frames, 15, [(0, "Jump"), (0, "Shoot"), (5, "Shoot"),
+										(10, "Shoot")])
+
+
+scenarios = [
+	Scenario("menu", 1200, 1, menu=True),
+	Scenario("scroll-plains", 3000, 2, "Plains", script=runRight(3000), everyFrame=keepScrolling),
+	Scenario("scroll-hills", 3000, 3, "Hills", script=runRight(3000), everyFrame=keepScrolling),
+	Scenario("scroll-mountains", 3000, 4, "Mountains", script=runRight(3000), everyFrame=keepScrolling),
+	Scenario("enemy-flood", 1500, 5, script=runAndFire(1500), everyFrame=flood),
+	Scenario("sustained-fire", 1500, 6, script=runAndFire(1500), everyFrame=keepScrolling),
+	Scenario("boss-fight", 800, 7, script=fightBoss(800),
+			 start=project.finalBossEvent, everyFrame=chaseBoss),
+]
+
+
+# Returns the mean, median, 95th and 99th percentiles and maximum of a list
+# of frame times in seconds, in milliseconds.
+def summarize(times):
+	times = 1000*numpy.array(times)
+	return {"mean": float(times.mean()),
+			"p50": float(numpy.percentile(times, 50)),
+			"p95": float(numpy.percentile(times, 95)),
+			"p99": float(numpy.percentile(times, 99)),
+			"max": float(times.max())}
+
+
+# Plays a scenario and returns the summaries of its update and draw times.
+def run(scenario, poolSizes=None):
+	random.seed(scenario.seed)
+	numpy.random.seed(scenario.seed)
+	data = simulate.newMenu(poolSizes=poolSizes)
+	data.seed = scenario.seed
+	data.waitForTerrain = True
+	if scenario.menu == True:
+		update, draw = project.updateMenu, project.drawMenu
+	else:
+		data.contour = scenario.contour
+		project.initGame(data)
+		update, draw = project.updateGame, project.drawGame
+	if scenario.start != None:
+		scenario.start(data)
+
+	updateTimes = []
+	drawTimes = []
+	for frame in xrange(warmupFrames + scenario.frames):
+		if scenario.everyFrame != None:
+			scenario.everyFrame(data, frame)
+		if scenario.script != None:
+			scenario.script.apply(frame, data)
+		start = time.time()
+		update(data)
+		middle = time.time()
+		data.surface.beginFrame(project.cameraView(data))
+		draw(data)
+		end = time.time()
+		if frame >= warmupFrames:
+			updateTimes.append(middle - start)
+			drawTimes.append(end - middle)
+	project.stopTerrainProducer(data)
+	# Where things ended up, to check that a run played out like the last.
+	ending = [data.cameraAdjustDistance, data.map.endCol, len(data.enemies),
+			  len(data.bullets), len(data.finalBoss)]
+	return {"frames": scenario.frames, "seed": scenario.seed, "ending": ending,
+			"update": summarize(updateTimes), "draw": summarize(drawTimes)}
+
+
+# Prints each statistic against the baseline's, and returns the names of
+# the scenarios which are slower than the baseline by more than the
+# tolerance in their mean, p50 or p95.
+def compare(results, baseline, tolerance=tolerance):
+	regressions = []
+	for name in sorted(results):
+		if name not in baseline:
+			print("%-18s not in the baseline" % name)
+			continue
+		if results[name]["ending"] != baseline[name].get("ending"):
+			print("%-18s played out differently than the baseline" % name)
+		for phase in ["update", "draw"]:
+			flags = []
+			for statistic in ["mean", "p50", "p95", "p99", "max"]:
+				old = baseline[name][phase][statistic]
+				new = results[name][phase][statistic]
+				change = (new - old)/old if old > 0 else 0
+				flags.append("%s %.2f->%.2f (%+.0f%%)" % (statistic, old, new, 100*change))
+				if (statistic in ["mean", "p50", "p95"] and change > tolerance and
+						new - old > noiseFloor):
+					if name not in regressions:
+						regressions.append(name)
+			print("%-18s %-6s %s" % (name, phase, ", ".join(flags)))
+	return regressions
+
+
+def argument(arguments, name, default):
+	if name in arguments:
+		return arguments[arguments.index(name) + 1]
+	return default
+
+
+def main():
+	arguments = sys.argv[1:]
+	outPath = argument(arguments, "--out", None)
+	baselinePath = argument(arguments, "--compare", None)
+	only = argument(arguments, "--only", None)
+	allowed = float(argument(arguments, "--tolerance", tolerance))
+	poolSizes = project.poolSizesArgument(arguments)
+
+	os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+	results = {}
+	for scenario in scenarios:
+		if only != None and scenario.name not in only.split(","):
+			continue
+		results[scenario.name] = run(scenario, poolSizes)
+		update = results[scenario.name]["update"]
+		draw = results[scenario.name]["draw"]
+		print("%-18s update p50 %6.2f p95 %6.2f ms   draw p50 %6.2f p95 %6.2f ms" %
+			  (scenario.name, update["p50"], update["p95"], draw["p50"], draw["p95"]))
+
+	if outPath != None:
+		with open(outPath, "w") as outFile:
+			json.dump({"pygame": pygame.version.ver, "scenarios": results},
+					  outFile, indent=2, sort_keys=True)
+
+	if baselinePath != None:
+		with open(baselinePath) as baselineFile:
+			baseline = json.load(baselineFile)["scenarios"]
+		print("")
+		regressions = compare(results, baseline, allowed)
+		if len(regressions) > 0:
+			print("\nRegressions: " + ", ".join(regressions))
+			sys.exit(1)
+		print("\nNo regressions")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,104 @@
+import pygame
+
+##########
+# Screen #
+##########
+
+# Stands in for the display surface, which everything is drawn onto, and
+# presents each frame to the window.
+#
+# Normally each frame clears and presents the whole window. In the dirty
+# rect mode the screen remembers where each frame drew. While the view
+# stays still, the next frame only clears the places the last frame drew
+# on, draws the static layer (the terrain) back into the places which
+# changed, and presents just those places. Moving the view, such as when
+# the camera scrolls or the screen rumbles, redraws everything.
+class Screen(object):
+	maxDirtyRects = 256 # Past this many places, redrawing everything is cheaper.
+
+	def __init__(self, surface, dirtyRects=False, background=(0,0,0)):
+		self.surface = surface
+		self.dirtyRects = dirtyRects
+		self.background = background
+		self.static = StaticLayer(self)
+
+		self.view = None # The view the last frame was drawn from.
+		self.full = True # Whether this frame redraws everything.
+		self.drawn = [] # The places this frame has drawn on so far.
+		self.previous = [] # The places the last frame drew on.
+
+	def get_width(self):
+		return self.surface.get_width()
+
+	def get_height(self):
+		return self.surface.get_height()
+
+	def get_size(self):
+		return self.surface.get_size()
+
+	def get_rect(self):
+		return self.surface.get_rect()
+
+	# Makes the next frame redraw everything, as when a game restarts.
+	def invalidate(self):
+		self.view = None
+
+	# Clears the screen for a frame drawn from the given view, which is
+	# anything that moves every object on the screen when it changes.
+	def beginFrame(self, view):
+		self.full = (not self.dirtyRects or view != self.view or
+					 len(self.previous) > Screen.maxDirtyRects)
+		self.view = view
+		self.drawn = []
+		if self.full:
+			self.surface.fill(self.background)
+		else:
+			for rect in self.previous:
+				self.surface.fill(self.background, rect)
+
+	def blit(self, image, position, area=None, special_flags=0):
+		rect = self.surface.blit(image, position, area, special_flags)
+		if self.dirtyRects:
+			self.drawn.append(rect)
+		return rect
+
+	def fill(self, color, rect=None):
+		rect = self.surface.fill(color, rect)
+		if self.dirtyRects:
+			self.drawn.append(rect)
+		return rect
+
+	# Draws part of the static layer, which only changes when the view
+	# moves. Unless everything is being redrawn, it is only drawn into the
+	# places which were drawn on last frame or so far this frame.
+	def blitStatic(self, image, position):
+		if self.full:
+			return self.surface.blit(image, position)
+		imageRect = image.get_rect(topleft=position)
+		for rect in self.previous + self.drawn:
+			clipped = rect.clip(imageRect)
+			if clipped.width > 0 and clipped.height > 0:
+				area = clipped.move(-imageRect.x, -imageRect.y)
+				self.surface.blit(image, clipped.topleft, area)
+		return imageRect
+
+	# Shows the frame in the window.
+	def present(self):
+		if self.full:
+			pygame.display.update()
+		else:
+			pygame.display.update(self.previous + self.drawn)
+		self.previous = self.drawn
+
+
+# Draws onto a screen's static layer. The terrain chunks are drawn through
+# it, like any other surface.
+class StaticLayer(object):
+	def __init__(self, screen):
+		self.screen = screen
+
+	def get_width(self):
+		return self.screen.get_width()
+
+	def blit(self, image, position):
+		return self.screen.blitStatic(image, position)
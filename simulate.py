@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import pygame
+import bundle
+import project
+
+##############
+# Simulation #
+##############
+
+# Runs the game without a window, audio or frame cap, so it steps as fast
+# as the CPU allows, with the player driven by a script instead of the
+# keyboard. Run "python simulate.py" to see how many frames a second the
+# simulation alone runs at, or for example
+#   python simulate.py --frames 5000 --contour Hills --script run.txt --draw
+# where "--draw" also draws each frame off the screen. The pool sizes can be
+# set as in the game, as in "--pool-bullets 256"; see project.poolSizesArgument.
+#
+# A script has one action a line, "<frame> <action>", where the action is
+# one of the player's controls ("Jump", "Jump Released", "Shoot", "Dash",
+# "Down" or "Pause"), "Hold Left", "Release Left", "Hold Right",
+# "Release Right", "Axis " and a joystick direction, or "Restart". Lines
+# starting with # are ignored, so a recording made with "--record" is a
+# script too; see replay.py.
+
+# Takes the actions of a script on the frames they are meant for.
+class ScriptedInput(object):
+	def __init__(self, actions):
+		self.actions = {} # Maps a frame to the actions taken on it.
+		for frame, action in actions:
+			self.actions.setdefault(frame, []).append(action)
+
+	@staticmethod
+	def load(path):
+		actions = []
+		with open(path) as scriptFile:
+			for line in scriptFile:
+				line = line.strip()
+				if line == "" or line.startswith("#"):
+					continue
+				frame, action = line.split(None, 1)
+				actions.append((int(frame), action))
+		return ScriptedInput(actions)
+
+	# Takes this frame's actions. Returns True if one restarts the game.
+	def apply(self, frame, data):
+		restart = False
+		for action in self.actions.get(frame, []):
+			if action == "Restart":
+				restart = True
+			else:
+				project.applyAction(data, action)
+		return restart
+
+
+# The script used when none is given: run right, jumping every 20 frames
+# and shooting every 7.
+def defaultScript(frames):
+	actions = [(0, "Hold Right")]
+	for frame in xrange(frames):
+		if frame % 20 == 0:
+			actions.append((frame, "Jump"))
+		if frame % 7 == 0:
+			actions.append((frame, "Shoot"))
+	return ScriptedInput(actions)
+
+
+# Returns a headless game on its menu screen, ready to be stepped with
+# project.updateMenu. It needs no display or mixer, only pygame's fonts.
+# poolSizes, if given, overrides some of the pool sizes, as in
+# {"bullets": 256}.
+def newMenu(hordeSize=0, poolSizes=None):
+	pygame.font.init()
+	data = project.newData([], headless=True)
+	data.hordeSize = hordeSize
+	if poolSizes != None:
+		data.poolSizes.update(poolSizes)
+	data.keyboardMode = True
+	project.initSounds(data)
+	project.initMenu(data)
+	return data
+
+
+# Returns a headless game on the given terrain, ready to be stepped with
+# project.updateGame.
+def newGame(contour="Plains", hordeSize=0, poolSizes=None):
+	data = newMenu(hordeSize, poolSizes)
+	data.contour = contour
+	project.initGame(data)
+	return data
+
+
+# Starts a new game on the same terrain, from the menu's fresh state as the
+# game does, with the direction keys and the joystick held as they were, so
+# a script's held keys carry on into it.
+def restartGame(data):
+	player = data.player
+	held = (player.keyBoardLeft, player.keyBoardRight, data.axisDirection)
+	contour = data.contour
+	project.initMenu(data)
+	data.contour = contour
+	project.initGame(data)
+	data.player.keyBoardLeft, data.player.keyBoardRight, data.axisDirection = held
+
+
+# Steps the game for the given number of frames, drawing each one too if
+# draw is True. A new game starts when the script restarts it or the player
+# dies. Returns the seconds it took and the number of games played.
+def simulate(data, script, frames, draw=False):
+	games = 1
+	start = time.time()
+	for frame in xrange(frames):
+		if script.apply(frame, data) or data.player.alive == False:
+			restartGame(data)
+			games += 1
+		project.updateGame(data)
+		if draw == True:
+			data.surface.beginFrame(project.cameraView(data))
+			project.drawGame(data)
+	return time.time() - start, games
+
+
+def argument(arguments, name, default):
+	if name in arguments:
+		return arguments[arguments.index(name) + 1]
+	return default
+
+
+def main():
+	arguments = sys.argv[1:]
+	frames = int(argument(arguments, "--frames", 3000))
+	contour = argument(arguments, "--contour", "Plains")
+	scriptPath = argument(arguments, "--script", None)
+
+	os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+	if os.path.exists(bundle.bundlePath):
+		project.assetRegistry.useBundle(bundle.Bundle())
+	data = newGame(contour, project.hordeSizeArgument(arguments),
+				   project.poolSizesArgument(arguments))
+	if scriptPath == None:
+		script = defaultScript(frames)
+	else:
+		script = ScriptedInput.load(scriptPath)
+
+	seconds, games = simulate(data, script, frames, "--draw" in arguments)
+	project.stopTerrainProducer(data)
+	print("%d frames in %.2f s: %.0f frames per second (%d games, last score %d)" %
+		  (frames, seconds, frames/seconds, games, data.score))
+	print("Most at once: %d bullets, %d enemies, %d explosions "
+		  "(%d pool misses, %d explosions lost)" %
+		  (data.bullets.highWater, data.enemies.highWater, data.particles.highWater,
+		   data.bullets.misses + data.enemies.misses, data.particles.dropped))
+
+
+if __name__ == "__main__":
+	main()
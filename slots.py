@@ -0,0 +1,81 @@
+import numpy
+import timestep
+
+################
+# Packed Slots #
+################
+
+# Holds many things of one kind as parallel arrays instead of objects, like
+# the bullets, the enemies and the explosions. The live ones are packed into
+# the first `count` slots, so updating all of them is a handful of vectorized
+# operations. Each subclass lists its arrays' names and types in fields.
+#
+# The slots are made up front. When every one is in use, add doubles them,
+# which is counted as a miss, since they should be made big enough to start
+# with. The high-water mark is the most there have been at once.
+class PackedSlots(object):
+	fields = [] # (name, dtype) of each array.
+
+	def __init__(self, capacity):
+		self.count = 0
+		self.highWater = 0
+		self.misses = 0
+		for name, dtype in self.fields:
+			setattr(self, name, numpy.zeros(capacity, dtype=dtype))
+
+	def __len__(self):
+		return self.count
+
+	def capacity(self):
+		return len(self.arrays()[0])
+
+	def arrays(self):
+		return [getattr(self, name) for name, dtype in self.fields]
+
+	def grow(self):
+		self.misses += 1
+		for (name, dtype), old in zip(self.fields, self.arrays()):
+			new = numpy.zeros(2*len(old), dtype=dtype)
+			new[:self.count] = old[:self.count]
+			setattr(self, name, new)
+
+	# Returns the index of a new slot at the end of the live ones.
+	def add(self):
+		if self.count == self.capacity():
+			self.grow()
+		self.count += 1
+		if self.count > self.highWater:
+			self.highWater = self.count
+		return self.count - 1
+
+	# Drops the ones where keep is False and packs the rest together.
+	def keepOnly(self, keep):
+		kept = int(keep.sum())
+		if kept == self.count:
+			return
+		for array in self.arrays():
+			array[:kept] = array[:self.count][keep]
+		self.count = kept
+
+	def remove(self, hits):
+		self.keepOnly(~hits)
+
+	def clear(self):
+		self.count = 0
+
+
+# Slots for things which move, and are drawn between ticks. Their fields
+# include x and y, and previousX and previousY, where they were before the
+# last tick.
+class MovingSlots(PackedSlots):
+	# Remembers where they are, before a tick moves them.
+	def rememberPositions(self):
+		self.previousX[:self.count] = self.x[:self.count]
+		self.previousY[:self.count] = self.y[:self.count]
+
+	# Returns where to draw them, shifted by the camera, a fraction alpha of
+	# the way from where they were before the last tick to where they are.
+	def drawPositions(self, camera, alpha=1):
+		x = timestep.interpolate(self.previousX[:self.count], self.x[:self.count], alpha)
+		y = timestep.interpolate(self.previousY[:self.count], self.y[:self.count], alpha)
+		return x - camera, y
@@ -0,0 +1,101 @@
+import numpy
+
+#########################
+# Spatial Hash Collider #
+#########################
+
+# Finds which moving objects overlap without testing every pair of them.
+# Each layer of objects (the players, the bullets, the enemies...) is
+# inserted as arrays of box edges, and every box is filed under each of the
+# grid cells it covers. A pair query then only compares boxes which share a
+# cell, so its cost grows with the number of objects rather than with the
+# product of the two layers' sizes. Layers are rebuilt whenever the objects
+# in them have moved.
+class SpatialHash(object):
+	def __init__(self, cellSize):
+		self.cellSize = cellSize
+		self.layers = {} # Maps a layer's name to its (boxes, keys, items).
+
+	def clear(self):
+		self.layers = {}
+
+	# Returns a key for each cell which packs its column and row together.
+	def cellKeys(self, cols, rows):
+		return cols.astype(numpy.int64)*(2**32) + rows
+
+	# Files each box under the cells it covers, replacing the layer's old
+	# contents. Boxes are given as arrays of their edges.
+	def insert(self, layer, lefts, tops, rights, bottoms):
+		boxes = [numpy.asarray(edges, dtype=numpy.int64)
+				 for edges in (lefts, tops, rights, bottoms)]
+		lefts, tops, rights, bottoms = boxes
+		firstCols = lefts//self.cellSize
+		firstRows = tops//self.cellSize
+		# Boxes with no width or height still sit in the cell at their corner.
+		lastCols = numpy.maximum(rights-1, lefts)//self.cellSize
+		lastRows = numpy.maximum(bottoms-1, tops)//self.cellSize
+		widths = lastCols - firstCols + 1
+		heights = lastRows - firstRows + 1
+		counts = widths*heights
+
+		# One entry for every cell each box covers.
+		items = numpy.repeat(numpy.arange(len(lefts)), counts)
+		starts = numpy.cumsum(counts) - counts
+		offsets = numpy.arange(len(items)) - numpy.repeat(starts, counts)
+		cols = firstCols[items] + offsets % widths[items]
+		rows = firstRows[items] + offsets // widths[items]
+		keys = self.cellKeys(cols, rows)
+
+		order = numpy.argsort(keys, kind="mergesort")
+		self.layers[layer] = (boxes, keys[order], items[order])
+
+	def insertRects(self, layer, rects):
+		edges = numpy.array([(r.left, r.top, r.right, r.bottom) for r in rects],
+							dtype=numpy.int64).reshape(len(rects), 4)
+		self.insert(layer, edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3])
+
+	# Returns the (lefts, tops, rights, bottoms) arrays a layer was built from.
+	def boxes(self, layer):
+		return self.layers[layer][0]
+
+	# Returns two index arrays (a, b), one entry for each box in layerA which
+	# overlaps a box in layerB. The pairs are sorted by a, then by b.
+	def pairs(self, layerA, layerB):
+		boxesA, keysA, itemsA = self.layers[layerA]
+		boxesB, keysB, itemsB = self.layers[layerB]
+
+		# Every pair of entries which share a cell.
+		lows = numpy.searchsorted(keysB, keysA, "left")
+		counts = numpy.searchsorted(keysB, keysA, "right") - lows
+		entriesA = numpy.repeat(numpy.arange(len(keysA)), counts)
+		starts = numpy.cumsum(counts) - counts
+		entriesB = (numpy.arange(len(entriesA)) - numpy.repeat(starts, counts) +
+					numpy.repeat(lows, counts))
+
+		# Boxes which share more than one cell are only paired once.
+		sizeB = max(len(boxesB[0]), 1)
+		pairKeys = numpy.unique(itemsA[entriesA]*sizeB + itemsB[entriesB])
+		a = pairKeys // sizeB
+		b = pairKeys % sizeB
+
+		leftsA, topsA, rightsA, bottomsA = boxesA
+		leftsB, topsB, rightsB, bottomsB = boxesB
+		overlapping = ((leftsA[a] < rightsB[b]) & (rightsA[a] > leftsB[b]) &
+					   (topsA[a] < bottomsB[b]) & (bottomsA[a] > topsB[b]))
+		return a[overlapping], b[overlapping]
+
+
+# Given pairs sorted by a, returns the pairs where b appears for the first
+# time. When several objects compete for the same object b, this picks the
+# one with the lowest index, as a loop over them in order would.
+def firstClaims(a, b):
+	unused, first = numpy.unique(b, return_index=True)
+	first.sort()
+	return a[first], b[first]
+
+
+# Returns how many times each index below size appears in indices.
+def countOf(indices, size):
+	counts = numpy.zeros(size, dtype=int)
+	numpy.add.at(counts, indices, 1)
+	return counts
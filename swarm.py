@@ -0,0 +1,110 @@
+import numpy
+import slots
+import spatial
+
+###############
+# Enemy Swarm #
+###############
+
+# Holds every jumper enemy as component arrays instead of sprites. Each
+# frame the whole swarm falls, picks a direction towards the players,
+# bounces off the terrain and reflects off the sides of the screen in one
+# batched step, so thousands of enemies cost about as much as a handful.
+class EnemySwarm(slots.MovingSlots):
+	horizontalTopSpeed = 15
+	verticalTopSpeed = 20
+	fields = [("x", numpy.int32), ("y", numpy.int32),
+			  ("previousX", numpy.int32), ("previousY", numpy.int32),
+			  ("dx", numpy.float64), ("dy", numpy.float64)]
+
+	def __init__(self, image, gravity, terminalVelocity, seed, capacity=64):
+		self.image = image
+		self.width, self.height = image.get_size()
+		self.gravity = gravity
+		self.terminalVelocity = terminalVelocity
+		self.random = numpy.random.RandomState(seed)
+		slots.MovingSlots.__init__(self, capacity)
+
+	# Starts the random bounces over from a new seed, as for a new game.
+	def reseed(self, seed):
+		self.random = numpy.random.RandomState(seed)
+
+	def spawn(self, x, y):
+		i = self.add()
+		self.x[i] = self.previousX[i] = x
+		self.y[i] = self.previousY[i] = y
+		self.dx[i] = 0
+		self.dy[i] = 0
+
+	# Returns the enemies' boxes as (lefts, tops, rights, bottoms) arrays.
+	def boxes(self):
+		x = self.x[:self.count]
+		y = self.y[:self.count]
+		return x, y, x + self.width, y + self.height
+
+	def center(self, i):
+		return (int(self.x[i]) + self.width/2, int(self.y[i]) + self.height/2)
+
+	# Advances every enemy by one frame. The players are read from the
+	# "players" layer of the spatial hash grid, and the enemies are filed
+	# under its "enemies" layer as they move. Returns a list of (enemy,
+	# player, dx) for the enemies which touched a player, where dx is the
+	# enemy's speed when it touched. Only the first enemy touching each
+	# player is listed.
+	def step(self, tileMap, tileSize, tile, grid, cameraLeft, screenWidth):
+		n = self.count
+		x, y = self.x[:n], self.y[:n]
+		dx, dy = self.dx[:n], self.dy[:n]
+
+		# Movement. Rects only move by whole pixels.
+		x += dx.astype(numpy.int32)
+		y += dy.astype(numpy.int32)
+
+		# Gravity
+		falling = dy < self.terminalVelocity
+		dy[falling] += self.gravity
+
+		# Intelligence: head towards the players' average position. This
+		# compares the distance against the enemy's on-screen position, as
+		# the sprite version always did.
+		centerx = x + self.width/2
+		distance = numpy.zeros(n)
+		playerLefts, playerTops, playerRights, playerBottoms = grid.boxes("players")
+		if len(playerLefts) > 0:
+			playerCenterx = int(((playerLefts + playerRights)//2).sum())/len(playerLefts)
+			distance = playerCenterx - centerx
+		direction = numpy.sign(distance - (centerx - cameraLeft))
+
+		# Bounce off the terrain in a random direction.
+		lefts, tops, rights, bottoms = self.boxes()
+		bouncing = tileMap.anyInBoxes(lefts, tops, rights, bottoms, tileSize, tile)
+		bounces = int(bouncing.sum())
+		if bounces > 0:
+			horizontal = self.random.randint(5, self.horizontalTopSpeed+1, bounces)
+			vertical = self.random.randint(10, self.verticalTopSpeed+1, bounces)
+			dx[bouncing] = direction[bouncing]*horizontal
+			dy[bouncing] = -vertical
+
+		# Touching the players
+		grid.insert("enemies", lefts, tops, rights, bottoms)
+		enemies, players = grid.pairs("enemies", "players")
+		enemies, players = spatial.firstClaims(enemies, players)
+		hits = []
+		for i in xrange(len(players)):
+			enemy = int(enemies[i])
+			hits.append((enemy, int(players[i]), float(dx[enemy])))
+
+		# Reflect off the sides of the screen.
+		pastLeft = x <= cameraLeft
+		pastRight = ~pastLeft & (x + self.width >= cameraLeft + screenWidth)
+		x[pastLeft] = cameraLeft
+		x[pastRight] = cameraLeft + screenWidth - self.width
+		reflecting = pastLeft | pastRight
+		dx[reflecting] = -dx[reflecting]
+
+		return hits
+
+	def draw(self, surface, camera, alpha=1):
+		x, y = self.drawPositions(camera, alpha)
+		for i in xrange(self.count):
+			surface.blit(self.image, (x[i], y[i]))
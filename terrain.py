@@ -0,0 +1,313 @@
+import atexit
+import numpy
+import pygame
+import Queue
+import threading
+import weakref
+
+# Defining the tile types
+air = 0
+ground = 1
+underground = 2
+
+
+############
+# Tile Map #
+############
+
+# A fixed-width ring buffer which holds the columns of the map that are
+# currently in use. Columns are addressed by their world index, which keeps
+# growing as the player runs, but only the columns in [firstCol, endCol) are
+# stored. Old columns are dropped in order from the left side, so the
+# memory used by the map never grows.
+class TileMap(object):
+	def __init__(self, rows, capacity):
+		self.rows = rows
+		self.capacity = capacity
+		self.cells = numpy.zeros((rows, capacity), dtype=numpy.uint8)
+
+		self.firstCol = 0 # The world index of the oldest column still held.
+		self.endCol = 0 # One past the world index of the newest column.
+
+	def isHeld(self, col):
+		return self.firstCol <= col < self.endCol
+
+	def isFull(self):
+		return self.endCol - self.firstCol == self.capacity
+
+	# Returns a view of a column's cells, top row first.
+	def column(self, col):
+		if not self.isHeld(col):
+			raise IndexError("column %d is not held by the map" % col)
+		return self.cells[:, col % self.capacity]
+
+	# Fills a column with surface tiles from row top to row bottom, air above
+	# them and underground tiles below them.
+	def setColumn(self, col, top, bottom):
+		cells = self.column(col)
+		cells[:top] = air
+		cells[top:bottom+1] = ground
+		cells[bottom+1:] = underground
+
+	# Appends blank columns to the right side of the map.
+	def addColumns(self, count):
+		for i in xrange(count):
+			if self.isFull():
+				raise IndexError("the map is full; expire old columns first")
+			self.cells[:, self.endCol % self.capacity] = air
+			self.endCol += 1
+
+	# Drops the oldest column.
+	def expireColumn(self):
+		if self.firstCol == self.endCol:
+			raise IndexError("the map has no columns to expire")
+		self.cells[:, self.firstCol % self.capacity] = air
+		self.firstCol += 1
+
+	# Returns the (row, col) of each cell holding the given tile which overlaps
+	# the world-space box [left, right) x [top, bottom). Only the cells under
+	# the box are looked at, so the cost doesn't depend on the size of the map.
+	def cellsInBox(self, left, top, right, bottom, tileSize, tile):
+		firstCol = max(left//tileSize, self.firstCol)
+		lastCol = min((right-1)//tileSize, self.endCol-1)
+		firstRow = max(top//tileSize, 0)
+		lastRow = min((bottom-1)//tileSize, self.rows-1)
+
+		cells = []
+		for col in xrange(firstCol, lastCol+1):
+			column = self.cells[:, col % self.capacity]
+			for row in xrange(firstRow, lastRow+1):
+				if column[row] == tile:
+					cells.append((row, col))
+		return cells
+
+	# Returns, for each of a batch of world-space boxes, whether any cell
+	# holding the given tile overlaps it. The boxes are given as arrays, and
+	# all of them are tested together one cell offset at a time.
+	def anyInBoxes(self, lefts, tops, rights, bottoms, tileSize, tile):
+		firstCols = lefts//tileSize
+		lastCols = (rights-1)//tileSize
+		firstRows = tops//tileSize
+		lastRows = (bottoms-1)//tileSize
+
+		hits = numpy.zeros(len(lefts), dtype=bool)
+		if len(lefts) == 0:
+			return hits
+		for colOffset in xrange(int((lastCols - firstCols).max()) + 1):
+			cols = firstCols + colOffset
+			inCol = ((cols <= lastCols) & (cols >= self.firstCol) &
+					 (cols < self.endCol))
+			for rowOffset in xrange(int((lastRows - firstRows).max()) + 1):
+				rows = firstRows + rowOffset
+				inCell = inCol & (rows <= lastRows) & (rows >= 0) & (rows < self.rows)
+				cells = self.cells[numpy.clip(rows, 0, self.rows-1),
+								   cols % self.capacity]
+				hits |= inCell & (cells == tile)
+		return hits
+
+
+##########################
+# Heightfield Generation #
+##########################
+
+# The chances of the surface stepping (down, up) rather than across at each
+# step of the walk which lays it out. They match the old per-tile walk, which
+# picked one of eleven values between 0 and 1 and compared it to (.2, .4),
+# (.3, .6) or (.4, .8).
+contourPresets = {
+	"Plains": (3/11.0, 2/11.0),
+	"Hills": (3/11.0, 3/11.0),
+	"Mountains": (5/11.0, 4/11.0),
+}
+
+
+# Lays out the surface of the map a batch of columns at a time. Each column
+# is a walk of up to maxSteps vertical steps which ends when it steps across,
+# and the surface covers every row the walk visits in that column. The walk
+# reflects off highestRow and lowestRow. All of the random draws come from
+# the generator's own seeded stream, one batch at a time, so the same seed
+# and contour always give the same terrain however the columns are batched.
+class TerrainGenerator(object):
+	def __init__(self, contour, seed, highestRow, lowestRow, startRow,
+				 maxSteps=None):
+		self.chances = contourPresets[contour]
+		self.random = numpy.random.RandomState(seed)
+		self.highestRow = highestRow
+		self.span = lowestRow - highestRow
+		if maxSteps is None:
+			maxSteps = 2*self.span
+		self.maxSteps = maxSteps
+
+		# The walk's position before folding it back between the bounds.
+		self.position = startRow - highestRow
+
+	# Folds walk positions back between the highest and lowest rows.
+	def fold(self, positions):
+		period = 2*self.span
+		return self.highestRow + self.span - numpy.abs(positions % period - self.span)
+
+	# Returns the top and bottom surface rows of the next count columns.
+	def generate(self, count):
+		draws = self.random.random_sample((count, self.maxSteps))
+		down, up = self.chances
+		steps = numpy.where(draws < down, 1, numpy.where(draws < down+up, -1, 0))
+
+		# Each column stops at its first step across.
+		steps *= numpy.cumprod(steps != 0, axis=1)
+
+		positions = self.position + numpy.cumsum(steps.ravel()).reshape(steps.shape)
+		entries = numpy.empty(count, dtype=positions.dtype)
+		entries[0] = self.position
+		entries[1:] = positions[:-1, -1]
+		self.position = int(positions[-1, -1] % (2*self.span))
+
+		rows = self.fold(positions)
+		entryRows = self.fold(entries)
+		tops = numpy.minimum(rows.min(axis=1), entryRows)
+		bottoms = numpy.maximum(rows.max(axis=1), entryRows)
+		return tops, bottoms
+
+
+##################
+# Terrain Chunks #
+##################
+
+chunkColorKey = (255, 0, 255) # Not used by any tile image.
+
+# Draws one column's tiles into a strip one tile wide, with air left as the
+# colour key. Tiles are blended onto black, which copies their pixels
+# exactly, just as drawing them onto the black screen would.
+def bakeColumnStrip(top, bottom, rows, tileSize, tileImages):
+	strip = pygame.Surface((tileSize, rows*tileSize), 0, 32)
+	strip.fill(chunkColorKey)
+	strip.fill((0, 0, 0), (0, top*tileSize, tileSize, (rows-top)*tileSize))
+	for row in xrange(top, rows):
+		if row <= bottom:
+			strip.blit(tileImages[ground], (0, row*tileSize))
+		else:
+			strip.blit(tileImages[underground], (0, row*tileSize))
+	return strip
+
+
+# Returns a blank surface for a chunk. It uses the display's pixel format
+# when the display is 32 bit, so drawing it doesn't convert its pixels.
+def chunkSurface(size):
+	display = pygame.display.get_surface()
+	if display != None and display.get_bitsize() == 32:
+		return pygame.Surface(size, 0, display)
+	return pygame.Surface(size, 0, 32)
+
+
+# Terrain tiles never change once they are placed, so instead of drawing
+# each tile every frame they are baked into chunk surfaces which are
+# chunkCols columns wide. Drawing the terrain then takes a blit or two.
+# Air is left as the colour key, so chunks are drawn with the same pixels
+# the tiles would have been.
+class ChunkCache(object):
+	def __init__(self, rows, tileSize, chunkCols):
+		self.rows = rows
+		self.tileSize = tileSize
+		self.chunkCols = chunkCols
+		self.chunks = {} # Maps a chunk index to its surface.
+
+	# Copies a column strip into the chunk which holds its column.
+	def bakeColumn(self, col, strip):
+		index = col//self.chunkCols
+		if index not in self.chunks:
+			size = (self.chunkCols*self.tileSize, self.rows*self.tileSize)
+			chunk = chunkSurface(size)
+			chunk.fill(chunkColorKey)
+			chunk.set_colorkey(chunkColorKey)
+			self.chunks[index] = chunk
+		xPosition = (col - index*self.chunkCols)*self.tileSize
+		self.chunks[index].blit(strip, (xPosition, 0))
+
+	# Drops the chunks which only hold columns before firstCol.
+	def evictBefore(self, firstCol):
+		for index in self.chunks.keys():
+			if (index+1)*self.chunkCols <= firstCol:
+				del self.chunks[index]
+
+	# Blits the chunks which are on screen, given the camera's x position.
+	def draw(self, surface, camera):
+		chunkWidth = self.chunkCols*self.tileSize
+		for index, chunk in self.chunks.iteritems():
+			xPosition = index*chunkWidth - camera
+			if xPosition < surface.get_width() and xPosition + chunkWidth > 0:
+				surface.blit(chunk, (xPosition, 0))
+
+
+####################
+# Terrain Producer #
+####################
+
+# Generates terrain columns ahead of the camera on a worker thread, so the
+# cost of generating and baking them never lands on a frame. Each column is
+# handed over through a bounded queue as (col, top, bottom, strip), where
+# strip is the column baked by bakeColumnStrip. The worker sleeps whenever
+# the queue is full, so it only ever runs queueSize columns ahead.
+class TerrainProducer(threading.Thread):
+	def __init__(self, generator, rows, tileSize, tileImages,
+				 queueSize=64, batchSize=16):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.generator = generator
+		self.rows = rows
+		self.tileSize = tileSize
+		self.tileImages = tileImages
+		self.batchSize = batchSize
+		self.columns = Queue.Queue(queueSize)
+		self.stopped = threading.Event()
+
+	def start(self):
+		runningProducers.add(self)
+		threading.Thread.start(self)
+
+	def run(self):
+		col = 0
+		while not self.stopped.is_set():
+			tops, bottoms = self.generator.generate(self.batchSize)
+			for i in xrange(self.batchSize):
+				top = int(tops[i])
+				bottom = int(bottoms[i])
+				strip = bakeColumnStrip(top, bottom, self.rows, self.tileSize,
+										self.tileImages)
+				if not self.put((col, top, bottom, strip)):
+					return
+				col += 1
+
+	# Waits for room in the queue. Returns False if the producer was stopped.
+	def put(self, column):
+		while not self.stopped.is_set():
+			try:
+				self.columns.put(column, timeout=.1)
+				return True
+			except Queue.Full:
+				pass
+		return False
+
+	# Returns the next column, or None if block is False and none is ready.
+	def take(self, block=True):
+		while True:
+			try:
+				return self.columns.get(block, .1)
+			except Queue.Empty:
+				if not block:
+					return None
+				if not self.is_alive():
+					raise RuntimeError("the terrain producer has stopped")
+
+	def stop(self):
+		self.stopped.set()
+		self.join()
+
+
+# A daemon thread can't be left running while the interpreter tears down
+# the modules it uses, so any producers still running are stopped at exit.
+runningProducers = weakref.WeakSet()
+
+def stopRunningProducers():
+	for producer in list(runningProducers):
+		producer.stop()
+
+atexit.register(stopRunningProducers)
@@ -0,0 +1,52 @@
+import pygame
+
+############
+# Textures #
+############
+
+# Returns a copy of an image in the display's pixel format, so blitting it
+# to the screen doesn't convert its pixels on every blit. The display mode
+# has to be set first.
+def convertImage(image):
+	if image.get_flags() & pygame.SRCALPHA:
+		return image.convert_alpha()
+	return image.convert()
+
+
+# Packs many small images onto one sheet in the display's pixel format,
+# and hands back each image as a subsurface of the sheet. The images are
+# laid out in shelves: rows of images, tallest first, each row as tall as
+# the tallest image in it.
+class TextureAtlas(object):
+	def __init__(self, images, width=512):
+		images = sorted(images, key=lambda image: -image.get_height())
+		positions = []
+		x = y = shelfHeight = 0
+		for image in images:
+			imageWidth, imageHeight = image.get_size()
+			if imageWidth > width:
+				raise ValueError("an image is wider than the texture atlas")
+			if x + imageWidth > width:
+				x = 0
+				y += shelfHeight
+				shelfHeight = 0
+			positions.append((x, y))
+			x += imageWidth
+			shelfHeight = max(shelfHeight, imageHeight)
+
+		sheet = pygame.Surface((width, max(y + shelfHeight, 1)), pygame.SRCALPHA, 32)
+		self.sheet = sheet.convert_alpha()
+		self.sheet.fill((0, 0, 0, 0))
+		self.regions = {} # Maps each packed image to its subsurface.
+		for image, position in zip(images, positions):
+			# The images are copied without blending, onto a clear sheet in
+			# the same format, so their pixels are kept exactly.
+			converted = image.convert_alpha()
+			area = self.sheet.blit(converted, position, None, pygame.BLEND_RGBA_MAX)
+			self.regions[image] = self.sheet.subsurface(area)
+
+	def __contains__(self, image):
+		return image in self.regions
+
+	def __getitem__(self, image):
+		return self.regions[image]
@@ -0,0 +1,52 @@
+import time
+import numpy
+
+##################
+# Fixed Timestep #
+##################
+
+# Steps the game at a fixed rate however fast it's drawn, so it runs at the
+# same speed on every machine. Each frame the time since the last frame is
+# added up, and a tick is stepped for every whole tick's worth of it. What's
+# left over, as a fraction of a tick, is how far between the last two ticks
+# the frame is drawn.
+class FixedTimestep(object):
+	def __init__(self, tickRate=60, maxTicks=5):
+		self.tickLength = 1.0/tickRate
+		# Past this many ticks in one frame the game slows down instead of
+		# falling further behind trying to catch up.
+		self.maxTicks = maxTicks
+		self.reset()
+
+	# Forgets the time passed so far, as after loading a game.
+	def reset(self):
+		self.last = None
+		self.accumulated = self.tickLength # So the first frame steps once.
+
+	# Returns how many ticks to step this frame.
+	def advance(self, now=None):
+		if now == None:
+			now = time.time()
+		if self.last != None:
+			self.accumulated += max(now - self.last, 0)
+		self.last = now
+		ticks = int(self.accumulated/self.tickLength)
+		if ticks > self.maxTicks:
+			ticks = self.maxTicks
+			self.accumulated = ticks*self.tickLength
+		self.accumulated -= ticks*self.tickLength
+		return ticks
+
+	# How far between the last two ticks to draw this frame, from 0 to 1.
+	def alpha(self):
+		return min(self.accumulated/self.tickLength, 1.0)
+
+
+# Returns the position a fraction alpha of the way from previous to current,
+# in whole pixels. Works on numbers and on numpy arrays.
+def interpolate(previous, current, alpha):
+	if alpha == 1:
+		return current
+	if isinstance(current, numpy.ndarray):
+		return numpy.rint(previous + (current - previous)*alpha).astype(current.dtype)
+	return int(round(previous + (current - previous)*alpha))